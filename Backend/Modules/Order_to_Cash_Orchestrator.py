@@ -23,22 +23,34 @@ try:
         update_order_status,
         query_inventory,
         create_purchase_order,
+        reserve_order_stock,
+        commit_reservation,
+        release_reservation,
         generate_invoice,
         call_djust_pay,
         notify,
         kb_ingest_indexer,
     )
+    from .cassette import install_cassette
+    from .admission import install_admission
+    from .retrieval import HybridRetriever
 except ImportError:
     from tools import (
         fetch_orders,
         update_order_status,
         query_inventory,
         create_purchase_order,
+        reserve_order_stock,
+        commit_reservation,
+        release_reservation,
         generate_invoice,
         call_djust_pay,
         notify,
         kb_ingest_indexer,
     )
+    from cassette import install_cassette
+    from admission import install_admission
+    from retrieval import HybridRetriever
 
 # ----------------------------
 # Load environment variables
@@ -88,6 +100,9 @@ knowledge_base = Knowledge(
     max_results=5
 )
 
+# BM25 sur documents/*.md fusionné avec PgVector + cache LRU des embeddings de requête
+hybrid_retriever = HybridRetriever(knowledge_base).install()
+
 # =============================
 # Agent 1: Order Intake Agent
 # =============================
@@ -137,6 +152,9 @@ InventoryAgent = Agent(
     tools=[
         query_inventory,
         create_purchase_order,
+        reserve_order_stock,
+        commit_reservation,
+        release_reservation,
         notify,
     ],
     description="""
@@ -147,12 +165,16 @@ InventoryAgent = Agent(
 
     ## Agent Responsibilities
     1. Vérifier la disponibilité des produits.
-    2. Créer des demandes de réapprovisionnement si nécessaire.
-    3. Notifier le client en cas de délai.
+    2. Réserver le stock de chaque commande (toutes les lignes ou aucune).
+    3. Confirmer la réservation une fois la commande payée, la libérer sinon.
+    4. Créer des demandes de réapprovisionnement si nécessaire.
+    5. Notifier le client en cas de délai.
 
     ## Tool Usage Guidelines
-    - query_inventory pour vérifier stock.
-    - create_purchase_order pour réapprovisionnement.
+    - query_inventory pour vérifier stock (quantité disponible = physique - réservé).
+    - reserve_order_stock pour réserver les lignes d'une commande ({"SKU": qty}).
+    - commit_reservation / release_reservation avec le reservation_id obtenu.
+    - create_purchase_order pour réapprovisionnement (stock attendu, non réservable avant réception).
     - notify pour communication.
 
     ## Sortie attendue
@@ -295,6 +317,33 @@ OrderToCashTeam = Team(
 )
 
 
+# =============================
+# Quota fournisseur débité à chaque appel modèle (voir admission.py)
+# =============================
+install_admission([
+    OrderIntakeAgent,
+    InventoryAgent,
+    PaymentAgent,
+    ExceptionAgent,
+    CoordinatorAgent,
+    OrderToCashTeam,
+])
+
+
+# =============================
+# Cassette record/replay (CASSETTE_MODE=record|replay)
+# Installée après l'admission : un appel rejoué ne consomme pas de quota
+# =============================
+cassette = install_cassette([
+    OrderIntakeAgent,
+    InventoryAgent,
+    PaymentAgent,
+    ExceptionAgent,
+    CoordinatorAgent,
+    OrderToCashTeam,
+])
+
+
 # =============================
 # Code d’exemple (exécution locale)
 # =============================
@@ -0,0 +1,336 @@
+# =============================
+# admission.py - Contrôle d'admission des routes LLM (token buckets + priorités)
+# =============================
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import inspect
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+
+# ----------------------------
+# Lanes (plus petit = plus prioritaire)
+# ----------------------------
+LANE_PRIORITIES = {
+    "payment": 0,
+    "exception": 1,
+    "intake": 2,
+    "summary": 3,
+}
+DEFAULT_LANE = "summary"
+
+# Débit par route : (requêtes / seconde, rafale)
+ROUTE_LIMITS = {
+    "/api/payment/process": (float(os.getenv("RATE_PAYMENT", "20")), 40),
+    "/api/exception/handle": (float(os.getenv("RATE_EXCEPTION", "10")), 20),
+    "/api/order/validate": (float(os.getenv("RATE_INTAKE", "10")), 20),
+    "/api/inventory/check": (float(os.getenv("RATE_INTAKE", "10")), 20),
+    "/api/coordinator/summary": (float(os.getenv("RATE_SUMMARY", "2")), 5),
+    "/team/query": (float(os.getenv("RATE_SUMMARY", "2")), 5),
+}
+
+# Requêtes simultanées par lane. Le total reste sous les 40 threads du pool
+# anyio : une rafale de summary ne peut pas priver payment de threads.
+LANE_MAX_INFLIGHT = {
+    "payment": int(os.getenv("ADMISSION_INFLIGHT_PAYMENT", "12")),
+    "exception": int(os.getenv("ADMISSION_INFLIGHT_EXCEPTION", "6")),
+    "intake": int(os.getenv("ADMISSION_INFLIGHT_INTAKE", "6")),
+    "summary": int(os.getenv("ADMISSION_INFLIGHT_SUMMARY", "4")),
+}
+
+# Quota modèle partagé par fournisseur, débité à chaque appel modèle : (appels / seconde, rafale)
+PROVIDER_LIMITS = {
+    "mistral": (float(os.getenv("RATE_PROVIDER_MISTRAL", "5")), 10),
+    "gemini": (float(os.getenv("RATE_PROVIDER_GEMINI", "5")), 10),
+}
+
+MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "50"))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+# Appels modèle des jobs en arrière-plan : aucune connexion HTTP n'attend, et un job
+# échoué n'est jamais relancé (ses outils ont pu s'exécuter) : attente bien plus longue
+JOB_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_JOB_MAX_WAIT_SECONDS", "600"))
+WAIT_SAMPLES = 1000
+
+MODEL_METHODS = ("invoke", "ainvoke", "invoke_stream", "ainvoke_stream")
+
+# Lane de la requête en cours, lue par les appels modèle faits dans ce contexte
+_current_lane: contextvars.ContextVar = contextvars.ContextVar("admission_lane", default=DEFAULT_LANE)
+# Attente maximale d'un jeton fournisseur dans ce contexte (None = MAX_QUEUE_WAIT_SECONDS)
+_current_max_wait: contextvars.ContextVar = contextvars.ContextVar("admission_max_wait", default=None)
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée (quota ou file saturée) ; `retry_after` en secondes."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def admission_lane(lane: str, max_wait: Optional[float] = None):
+    """
+    Les appels modèle exécutés dans ce bloc attendent dans la lane donnée,
+    au plus `max_wait` secondes (par défaut MAX_QUEUE_WAIT_SECONDS).
+    """
+    lane_token = _current_lane.set(lane)
+    wait_token = _current_max_wait.set(max_wait)
+    try:
+        yield
+    finally:
+        _current_max_wait.reset(wait_token)
+        _current_lane.reset(lane_token)
+
+
+# =============================
+# Token bucket
+# =============================
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def scale(self, factor: float) -> None:
+        """Multiplie débit et rafale (rafale d'au moins un jeton)."""
+        with self._lock:
+            self.rate *= factor
+            self.capacity = max(1.0, self.capacity * factor)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def time_until_token(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else math.inf
+
+
+# =============================
+# File à priorités d'un fournisseur
+# =============================
+class _ProviderGate:
+    """Un bucket, un heap et une condition par fournisseur : Gemini n'attend pas Mistral."""
+
+    def __init__(self, name: str, rate: float, capacity: float, max_depth: int, max_wait: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self._max_depth = max_depth
+        self._max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self.depth: Dict[str, int] = {lane: 0 for lane in LANE_PRIORITIES}
+        self.waits: Dict[str, List[float]] = {lane: [] for lane in LANE_PRIORITIES}
+        self.admitted: Dict[str, int] = {lane: 0 for lane in LANE_PRIORITIES}
+        self.rejected: Dict[str, int] = {lane: 0 for lane in LANE_PRIORITIES}
+
+    def acquire(self, lane: str, max_wait: Optional[float] = None) -> float:
+        entry = (LANE_PRIORITIES[lane], next(self._seq))
+        started = time.monotonic()
+        deadline = started + (self._max_wait if max_wait is None else max_wait)
+        with self._cond:
+            if self.depth[lane] >= self._max_depth:
+                self.rejected[lane] += 1
+                raise AdmissionRejected(
+                    f"Queue full for lane '{lane}' on {self.name}", self.bucket.time_until_token() + 1
+                )
+            heapq.heappush(self._waiters, entry)
+            self.depth[lane] += 1
+            try:
+                while True:
+                    if self._waiters[0] == entry and self.bucket.try_acquire():
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected[lane] += 1
+                        raise AdmissionRejected(
+                            f"Timed out waiting for {self.name} quota", self.bucket.time_until_token() + 1
+                        )
+                    self._cond.wait(min(remaining, max(self.bucket.time_until_token(), 0.01)))
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self.depth[lane] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            samples = self.waits[lane]
+            samples.append(waited)
+            if len(samples) > WAIT_SAMPLES:
+                del samples[: len(samples) - WAIT_SAMPLES]
+            self.admitted[lane] += 1
+        return waited
+
+
+# =============================
+# Contrôleur d'admission
+# =============================
+class AdmissionController:
+    """
+    1. Entrée de route (non bloquante) : débit par route et nombre de requêtes
+       simultanées par lane ; au-delà, refus immédiat (429).
+    2. Appel modèle : chaque invoke débite le quota de son fournisseur. Les
+       appels en attente sont servis par priorité de lane (payment > exception
+       > intake > summary), avec une profondeur bornée par lane ; au-delà, ou
+       après MAX_QUEUE_WAIT_SECONDS (JOB_MAX_WAIT_SECONDS pour les jobs),
+       AdmissionRejected.
+    """
+
+    def __init__(self, route_limits: Dict[str, tuple] = ROUTE_LIMITS,
+                 provider_limits: Dict[str, tuple] = PROVIDER_LIMITS,
+                 lane_max_inflight: Dict[str, int] = LANE_MAX_INFLIGHT,
+                 max_queue_depth: int = MAX_QUEUE_DEPTH,
+                 max_wait_seconds: float = MAX_QUEUE_WAIT_SECONDS):
+        self._routes = {route: TokenBucket(*limit) for route, limit in route_limits.items()}
+        self._providers = {
+            name: _ProviderGate(name, rate, capacity, max_queue_depth, max_wait_seconds)
+            for name, (rate, capacity) in provider_limits.items()
+        }
+        self._max_inflight = dict(lane_max_inflight)
+        self._max_depth = max_queue_depth
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, int] = {lane: 0 for lane in LANE_PRIORITIES}
+        self._route_rejected: Dict[str, int] = {lane: 0 for lane in LANE_PRIORITIES}
+
+    # ----------------------------
+    # Entrée de route
+    # ----------------------------
+    def enter_route(self, route: str, lane: str) -> None:
+        route_bucket = self._routes.get(route)
+        with self._lock:
+            if route_bucket is not None and not route_bucket.try_acquire():
+                self._route_rejected[lane] += 1
+                raise AdmissionRejected(f"Rate limit exceeded for {route}", route_bucket.time_until_token())
+            limit = self._max_inflight.get(lane)
+            if limit is not None and self._inflight[lane] >= limit:
+                self._route_rejected[lane] += 1
+                raise AdmissionRejected(f"Too many concurrent '{lane}' requests", 1.0)
+            self._inflight[lane] += 1
+
+    def leave_route(self, lane: str) -> None:
+        with self._lock:
+            self._inflight[lane] -= 1
+
+    def share_between(self, workers: int) -> None:
+        """
+        Mode pré-forké : chaque worker a son contrôleur ; débits et rafales de
+        route et de fournisseur sont divisés par le nombre de workers pour que
+        le total reste celui configuré. Les plafonds de requêtes simultanées
+        restent par processus (ils protègent le pool de threads de chaque worker).
+        """
+        if workers <= 1:
+            return
+        for bucket in list(self._routes.values()) + [gate.bucket for gate in self._providers.values()]:
+            bucket.scale(1.0 / workers)
+
+    # ----------------------------
+    # Appel modèle
+    # ----------------------------
+    def acquire_model_call(self, provider: Optional[str], lane: Optional[str] = None,
+                           max_wait: Optional[float] = None) -> float:
+        """Bloque jusqu'à obtention d'un jeton fournisseur ; retourne l'attente (s)."""
+        gate = self._providers.get(provider) if provider else None
+        if gate is None:
+            return 0.0
+        return gate.acquire(lane or _current_lane.get(),
+                            _current_max_wait.get() if max_wait is None else max_wait)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = dict(self._inflight)
+            route_rejected = dict(self._route_rejected)
+        lanes = {}
+        for lane in LANE_PRIORITIES:
+            samples = sorted(s for gate in self._providers.values() for s in gate.waits[lane])
+            lanes[lane] = {
+                "priority": LANE_PRIORITIES[lane],
+                "inflight": inflight[lane],
+                "max_inflight": self._max_inflight.get(lane),
+                "queue_depth": sum(gate.depth[lane] for gate in self._providers.values()),
+                "admitted_model_calls": sum(gate.admitted[lane] for gate in self._providers.values()),
+                "rejected": route_rejected[lane] + sum(gate.rejected[lane] for gate in self._providers.values()),
+                "wait_ms_avg": round(1000 * sum(samples) / len(samples), 2) if samples else 0.0,
+                "wait_ms_p95": round(1000 * samples[math.ceil(0.95 * len(samples)) - 1], 2) if samples else 0.0,
+                "wait_ms_max": round(1000 * samples[-1], 2) if samples else 0.0,
+            }
+        providers = {
+            name: {"queue_depth": sum(gate.depth.values()), "admitted": sum(gate.admitted.values())}
+            for name, gate in self._providers.items()
+        }
+        return {"lanes": lanes, "providers": providers, "max_queue_depth": self._max_depth}
+
+
+admission_controller = AdmissionController()
+
+
+def provider_of(model: Any) -> Optional[str]:
+    """Nom du fournisseur (clé de PROVIDER_LIMITS) d'un modèle agno."""
+    name = type(model).__name__.lower()
+    for provider in PROVIDER_LIMITS:
+        if provider in name:
+            return provider
+    return None
+
+
+# =============================
+# Branchement sur les modèles agno
+# =============================
+def _wrap_model_call(controller: AdmissionController, provider: str, fn):
+    if inspect.isasyncgenfunction(fn):
+        async def wrapper(*args, **kwargs):
+            await asyncio.to_thread(controller.acquire_model_call, provider, _current_lane.get(),
+                                    _current_max_wait.get())
+            async for item in fn(*args, **kwargs):
+                yield item
+    elif inspect.iscoroutinefunction(fn):
+        async def wrapper(*args, **kwargs):
+            await asyncio.to_thread(controller.acquire_model_call, provider, _current_lane.get(),
+                                    _current_max_wait.get())
+            return await fn(*args, **kwargs)
+    elif inspect.isgeneratorfunction(fn):
+        def wrapper(*args, **kwargs):
+            controller.acquire_model_call(provider)
+            yield from fn(*args, **kwargs)
+    else:
+        def wrapper(*args, **kwargs):
+            controller.acquire_model_call(provider)
+            return fn(*args, **kwargs)
+
+    wrapper.__wrapped__ = fn
+    wrapper.__name__ = getattr(fn, "__name__", "invoke")
+    return wrapper
+
+
+def install_admission(agents, controller: AdmissionController = admission_controller) -> None:
+    """Débite le quota fournisseur à chaque appel modèle des agents / équipes donnés."""
+    for agent in agents:
+        model = getattr(agent, "model", None)
+        provider = provider_of(model) if model is not None else None
+        if provider is None or getattr(model, "_admission", None) is controller:
+            continue
+        for method in MODEL_METHODS:
+            fn = getattr(model, method, None)
+            if fn is not None:
+                object.__setattr__(model, method, _wrap_model_call(controller, provider, fn))
+        object.__setattr__(model, "_admission", controller)
@@ -0,0 +1,307 @@
+# =============================
+# cassette.py - Enregistrement / rejeu des appels modèles et outils
+# =============================
+import atexit
+import base64
+import dataclasses
+import enum
+import gzip
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional
+
+
+# ----------------------------
+# Paramètres (variables d'environnement)
+# ----------------------------
+# CASSETTE_MODE : off | record | replay
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_DIR = os.getenv(
+    "CASSETTE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+)
+CASSETTE_NAME = os.getenv("CASSETTE_NAME", "default")
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+MODEL_METHODS = ("invoke", "ainvoke", "invoke_stream", "ainvoke_stream")
+CASSETTE_FORMAT_VERSION = 1
+
+# Seuls ces modules peuvent être reconstruits au rejeu (réponses fournisseurs / agno)
+REPLAYABLE_MODULE_PREFIXES = ("agno.", "mistralai.", "google.genai.", "google.generativeai.")
+
+
+class CassetteMissError(Exception):
+    """Levée en mode replay quand aucun enregistrement ne correspond à l'appel."""
+
+
+def _canonical(value: Any) -> Any:
+    """Représentation stable d'un argument (messages agno, dicts, objets) pour la clé."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "role") and hasattr(value, "content"):
+        return {
+            "role": value.role,
+            "content": _canonical(value.content),
+            "tool_calls": _canonical(getattr(value, "tool_calls", None)),
+        }
+    if hasattr(value, "name") and hasattr(value, "parameters"):
+        return {"name": value.name}
+    return type(value).__name__
+
+
+def _type_path(value: Any) -> str:
+    cls = type(value)
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _encode(value: Any) -> Any:
+    """Convertit une réponse (pydantic, dataclass agno...) en JSON typé, sans pickle."""
+    if isinstance(value, enum.Enum):
+        return {"__type__": _type_path(value), "kind": "enum", "data": _encode(value.value)}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, bytes):
+        return {"__type__": "bytes", "kind": "bytes", "data": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        encoded = {str(k): _encode(v) for k, v in value.items()}
+        # Un dict métier contenant déjà "__type__" est encapsulé pour ne pas être pris pour un objet
+        return {"__type__": "dict", "kind": "rawdict", "data": encoded} if "__type__" in encoded else encoded
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if hasattr(value, "model_dump") and hasattr(type(value), "model_validate"):
+        return {"__type__": _type_path(value), "kind": "pydantic", "data": value.model_dump(mode="json")}
+    if hasattr(value, "to_dict") and hasattr(type(value), "from_dict"):
+        return {"__type__": _type_path(value), "kind": "dict", "data": _encode(value.to_dict())}
+    if dataclasses.is_dataclass(value):
+        fields = {f.name: _encode(getattr(value, f.name)) for f in dataclasses.fields(value) if f.init}
+        return {"__type__": _type_path(value), "kind": "dataclass", "data": fields}
+    raise TypeError(f"Cannot record value of type {_type_path(value)}")
+
+
+def _load_type(path: str):
+    module_name, _, qualname = path.partition(":")
+    if not module_name.startswith(REPLAYABLE_MODULE_PREFIXES):
+        raise CassetteMissError(f"Refusing to rebuild untrusted type '{path}' from cassette")
+    obj = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__type__" not in value:
+        return {k: _decode(v) for k, v in value.items()}
+    kind, data = value["kind"], value["data"]
+    if kind == "bytes":
+        return base64.b64decode(data)
+    if kind == "rawdict":
+        return {k: _decode(v) for k, v in data.items()}
+    cls = _load_type(value["__type__"])
+    if kind == "enum":
+        return cls(_decode(data))
+    if kind == "pydantic":
+        return cls.model_validate(data)
+    if kind == "dict":
+        return cls.from_dict(_decode(data))
+    return cls(**{k: _decode(v) for k, v in data.items()})
+
+
+def _key(kind: str, name: str, args, kwargs) -> str:
+    # assistant_message / run_response sont des objets de sortie, pas des entrées
+    kwargs = {k: v for k, v in kwargs.items() if k not in ("assistant_message", "run_response")}
+    payload = json.dumps([kind, name, _canonical(list(args)), _canonical(kwargs)], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# =============================
+# Cassette
+# =============================
+class Cassette:
+    """
+    Fichier JSON gzip contenant, par clé d'appel (hash des entrées),
+    la liste ordonnée des réponses observées. En rejeu, des appels identiques
+    successifs reçoivent les réponses dans l'ordre d'enregistrement.
+
+    Aucun pickle : le rejeu ne reconstruit que des types de
+    REPLAYABLE_MODULE_PREFIXES, une cassette partagée n'exécute pas de code.
+    """
+
+    def __init__(self, name: str = CASSETTE_NAME, mode: str = CASSETTE_MODE,
+                 directory: str = CASSETTE_DIR):
+        self.name = name
+        self.mode = mode
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name}.cassette.json.gz")
+        self._entries: Dict[str, List[Any]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if mode == MODE_REPLAY:
+            if not os.path.exists(self.path):
+                raise CassetteMissError(f"Cassette file not found: {self.path}")
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                self._entries = json.load(f)["entries"]
+        elif mode == MODE_RECORD:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.save)
+
+    # ----------------------------
+    # Enregistrement / lecture
+    # ----------------------------
+    def record(self, key: str, value: Any) -> None:
+        try:
+            encoded = _encode(value)
+        except TypeError as e:
+            print(f"[⚠️] Cassette : réponse non enregistrée ({e})")
+            return
+        with self._lock:
+            self._entries.setdefault(key, []).append(encoded)
+            self._dirty = True
+
+    def replay(self, key: str, label: str) -> Any:
+        with self._lock:
+            values = self._entries.get(key)
+            if not values:
+                raise CassetteMissError(f"No recording for {label} in cassette '{self.name}'")
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            encoded = values[min(index, len(values) - 1)]
+        return _decode(encoded)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump({"version": CASSETTE_FORMAT_VERSION, "entries": self._entries}, f,
+                          separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def for_worker(self, worker_id: int) -> None:
+        """
+        En mode pré-forké, chaque worker enregistre dans son propre fichier
+        ({name}.w{id}.cassette.json.gz) : plusieurs processus n'écrasent pas le même chemin.
+        """
+        if self.mode != MODE_RECORD:
+            return
+        with self._lock:
+            self.name = f"{self.name}.w{worker_id}"
+            self.path = os.path.join(self.directory, f"{self.name}.cassette.json.gz")
+            self._entries = {}
+            self._cursors = {}
+            self._dirty = False
+
+    # ----------------------------
+    # Wrappers
+    # ----------------------------
+    def wrap(self, kind: str, name: str, fn):
+        cassette = self
+        label = f"{kind}:{name}"
+
+        if inspect.isasyncgenfunction(fn):
+            async def wrapper(*args, **kwargs):
+                key = _key(kind, name, args, kwargs)
+                if cassette.mode == MODE_REPLAY:
+                    for item in cassette.replay(key, label):
+                        yield item
+                    return
+                chunks = []
+                async for item in fn(*args, **kwargs):
+                    chunks.append(item)
+                    yield item
+                cassette.record(key, chunks)
+        elif inspect.iscoroutinefunction(fn):
+            async def wrapper(*args, **kwargs):
+                key = _key(kind, name, args, kwargs)
+                if cassette.mode == MODE_REPLAY:
+                    return cassette.replay(key, label)
+                result = await fn(*args, **kwargs)
+                cassette.record(key, result)
+                return result
+        elif inspect.isgeneratorfunction(fn):
+            def wrapper(*args, **kwargs):
+                key = _key(kind, name, args, kwargs)
+                if cassette.mode == MODE_REPLAY:
+                    yield from cassette.replay(key, label)
+                    return
+                chunks = []
+                for item in fn(*args, **kwargs):
+                    chunks.append(item)
+                    yield item
+                cassette.record(key, chunks)
+        else:
+            def wrapper(*args, **kwargs):
+                key = _key(kind, name, args, kwargs)
+                if cassette.mode == MODE_REPLAY:
+                    return cassette.replay(key, label)
+                result = fn(*args, **kwargs)
+                cassette.record(key, result)
+                return result
+
+        wrapper.__wrapped__ = fn
+        wrapper._cassette = self
+        wrapper.__name__ = getattr(fn, "__name__", name)
+        wrapper.__doc__ = getattr(fn, "__doc__", None)
+        try:
+            wrapper.__signature__ = inspect.signature(fn)
+        except (TypeError, ValueError):
+            pass
+        return wrapper
+
+    def _wrap_model(self, model) -> None:
+        if model is None or getattr(model, "_cassette", None) is self:
+            return
+        model_name = f"{type(model).__name__}:{getattr(model, 'id', '')}"
+        for method in MODEL_METHODS:
+            fn = getattr(model, method, None)
+            if fn is not None:
+                object.__setattr__(model, method, self.wrap("model", f"{model_name}.{method}", fn))
+        object.__setattr__(model, "_cassette", self)
+
+    def _wrap_tool(self, tool) -> None:
+        # Fonctions @tool agno : l'exécution passe par `entrypoint`. agno le construit
+        # avec functools.wraps : __wrapped__ ne signale pas un wrapper de cassette.
+        entrypoint = getattr(tool, "entrypoint", None)
+        if entrypoint is not None:
+            if getattr(entrypoint, "_cassette", None) is not self:
+                tool.entrypoint = self.wrap("tool", tool.name, entrypoint)
+            return
+        # Toolkits (FileTools, CalculatorTools...) : une Function par outil
+        for function in getattr(tool, "functions", {}).values():
+            self._wrap_tool(function)
+
+    def install(self, agents) -> None:
+        """Branche la cassette sur les modèles et outils des agents / équipes donnés."""
+        if self.mode == MODE_OFF:
+            return
+        for agent in agents:
+            self._wrap_model(getattr(agent, "model", None))
+            for tool in getattr(agent, "tools", None) or []:
+                self._wrap_tool(tool)
+
+
+def install_cassette(agents, name: Optional[str] = None, mode: Optional[str] = None) -> Optional[Cassette]:
+    """Installe une cassette selon CASSETTE_MODE (ou `mode`) ; ne fait rien en mode off."""
+    mode = (mode or CASSETTE_MODE).lower()
+    if mode == MODE_OFF:
+        return None
+    cassette = Cassette(name=name or CASSETTE_NAME, mode=mode)
+    cassette.install(agents)
+    print(f"[🎞️] Cassette '{cassette.name}' active en mode {mode} ({cassette.path})")
+    return cassette
@@ -0,0 +1,482 @@
+# =============================
+# inventory.py - Moteur de réservation de stock (Order-to-Cash)
+# =============================
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# ----------------------------
+# Paramètres par défaut
+# ----------------------------
+DEFAULT_SHARDS = 32
+DEFAULT_TTL_SECONDS = 900.0
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inventory.sqlite3"
+)
+
+DEFAULT_STOCK = {
+    "SKU1": 120,
+    "SKU2": 45,
+    "SKU3": 0,
+}
+
+
+class ReservationError(Exception):
+    """Erreur levée lorsqu'une réservation est impossible ou inconnue."""
+
+
+@dataclass
+class StockLevel:
+    on_hand: int = 0
+    reserved: int = 0
+    # Quantité commandée aux fournisseurs, non encore réceptionnée (non réservable)
+    incoming: int = 0
+
+    @property
+    def available(self) -> int:
+        return self.on_hand - self.reserved
+
+
+@dataclass
+class Reservation:
+    reservation_id: str
+    lines: Dict[str, int]
+    expires_at: float
+    order_id: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+
+
+# =============================
+# Shard : un verrou + ses SKU
+# =============================
+class _Shard:
+    __slots__ = ("lock", "stock")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stock: Dict[str, StockLevel] = {}
+
+
+# =============================
+# Moteur de réservation
+# =============================
+class InventoryReservationEngine:
+    """
+    Compteurs de stock répartis en shards (un verrou par shard) pour que des
+    réservations concurrentes sur des SKU différents ne se bloquent pas.
+
+    Une réservation multi-SKU verrouille ses shards dans un ordre fixe
+    (index croissant) : elle est atomique et sans interblocage.
+    """
+
+    def __init__(self, shards: int = DEFAULT_SHARDS, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._ttl = ttl_seconds
+        self._reservations: Dict[str, Reservation] = {}
+        self._reservations_lock = threading.Lock()
+
+    # ----------------------------
+    # Helpers internes
+    # ----------------------------
+    def _shard_index(self, sku: str) -> int:
+        return zlib.crc32(sku.encode("utf-8")) % len(self._shards)
+
+    def _shard(self, sku: str) -> _Shard:
+        return self._shards[self._shard_index(sku)]
+
+    def _locked_shards(self, skus) -> List[_Shard]:
+        indexes = sorted({self._shard_index(sku) for sku in skus})
+        return [self._shards[i] for i in indexes]
+
+    def _pop_reservation(self, reservation_id: str, check_expiry: bool = False) -> Reservation:
+        with self._reservations_lock:
+            reservation = self._reservations.pop(reservation_id, None)
+        if reservation is None:
+            raise ReservationError(f"Unknown or expired reservation: {reservation_id}")
+        if check_expiry and reservation.expires_at <= time.time():
+            # Expirée mais pas encore balayée : on la libère au lieu de la confirmer
+            self._apply(reservation, consume=False)
+            raise ReservationError(f"Reservation expired: {reservation_id}")
+        return reservation
+
+    # ----------------------------
+    # Stock
+    # ----------------------------
+    def set_stock(self, sku: str, on_hand: int) -> None:
+        shard = self._shard(sku)
+        with shard.lock:
+            level = shard.stock.setdefault(sku, StockLevel())
+            level.on_hand = on_hand
+
+    def order_stock(self, sku: str, qty: int) -> int:
+        """Enregistre un réapprovisionnement commandé : ne devient disponible qu'à la réception."""
+        shard = self._shard(sku)
+        with shard.lock:
+            level = shard.stock.setdefault(sku, StockLevel())
+            level.incoming += qty
+            return level.incoming
+
+    def receive_stock(self, sku: str, qty: int) -> int:
+        """Réception marchandise : le stock physique augmente, l'attendu diminue."""
+        shard = self._shard(sku)
+        with shard.lock:
+            level = shard.stock.setdefault(sku, StockLevel())
+            level.on_hand += qty
+            level.incoming = max(0, level.incoming - qty)
+            return level.available
+
+    def get_level(self, sku: str) -> StockLevel:
+        shard = self._shard(sku)
+        with shard.lock:
+            level = shard.stock.get(sku, StockLevel())
+            return StockLevel(on_hand=level.on_hand, reserved=level.reserved, incoming=level.incoming)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        result: Dict[str, Dict[str, int]] = {}
+        for shard in self._shards:
+            with shard.lock:
+                for sku, level in shard.stock.items():
+                    result[sku] = {
+                        "on_hand": level.on_hand,
+                        "reserved": level.reserved,
+                        "available": level.available,
+                        "incoming": level.incoming,
+                    }
+        return result
+
+    # ----------------------------
+    # Réservations
+    # ----------------------------
+    def reserve(self, sku: str, qty: int, order_id: Optional[int] = None,
+                ttl_seconds: Optional[float] = None) -> Reservation:
+        return self.reserve_batch({sku: qty}, order_id=order_id, ttl_seconds=ttl_seconds)
+
+    def reserve_batch(self, lines: Dict[str, int], order_id: Optional[int] = None,
+                      ttl_seconds: Optional[float] = None) -> Reservation:
+        """Réserve toutes les lignes d'une commande, ou aucune."""
+        if not lines:
+            raise ReservationError("Nothing to reserve")
+        if any(qty <= 0 for qty in lines.values()):
+            raise ReservationError("Reserved quantities must be positive")
+
+        shards = self._locked_shards(lines)
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            shortages = {}
+            for sku, qty in lines.items():
+                level = self._shard(sku).stock.get(sku)
+                available = level.available if level else 0
+                if available < qty:
+                    shortages[sku] = available
+            if shortages:
+                raise ReservationError(f"Insufficient stock: {shortages}")
+            for sku, qty in lines.items():
+                self._shard(sku).stock[sku].reserved += qty
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+        ttl = self._ttl if ttl_seconds is None else ttl_seconds
+        reservation = Reservation(
+            reservation_id=f"RES-{uuid.uuid4().hex[:12]}",
+            lines=dict(lines),
+            expires_at=time.time() + ttl,
+            order_id=order_id,
+        )
+        with self._reservations_lock:
+            self._reservations[reservation.reservation_id] = reservation
+        return reservation
+
+    def _apply(self, reservation: Reservation, consume: bool) -> None:
+        shards = self._locked_shards(reservation.lines)
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            for sku, qty in reservation.lines.items():
+                level = self._shard(sku).stock[sku]
+                level.reserved -= qty
+                if consume:
+                    level.on_hand -= qty
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+    def commit(self, reservation_id: str) -> Reservation:
+        """Confirme la réservation : le stock réservé est décrémenté du stock physique."""
+        reservation = self._pop_reservation(reservation_id, check_expiry=True)
+        self._apply(reservation, consume=True)
+        return reservation
+
+    def release(self, reservation_id: str) -> Reservation:
+        """Annule la réservation : le stock redevient disponible."""
+        reservation = self._pop_reservation(reservation_id)
+        self._apply(reservation, consume=False)
+        return reservation
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """Libère les réservations arrivées à expiration."""
+        now = time.time() if now is None else now
+        with self._reservations_lock:
+            expired = [r for r in self._reservations.values() if r.expires_at <= now]
+            for reservation in expired:
+                del self._reservations[reservation.reservation_id]
+        for reservation in expired:
+            self._apply(reservation, consume=False)
+        return [r.reservation_id for r in expired]
+
+    def get_reservation(self, reservation_id: str) -> Optional[Reservation]:
+        with self._reservations_lock:
+            return self._reservations.get(reservation_id)
+
+
+# =============================
+# Moteur partagé entre processus (SQLite)
+# =============================
+class SqliteInventoryEngine:
+    """
+    Même interface que InventoryReservationEngine, état stocké en SQLite pour
+    être partagé par tous les workers du mode pré-forké. Chaque opération est
+    une transaction BEGIN IMMEDIATE : le verrou d'écriture SQLite sérialise les
+    réservations entre processus, il ne peut pas y avoir de survente.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self._path = path
+        self._ttl = ttl_seconds
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stock ("
+                " sku TEXT PRIMARY KEY, on_hand INTEGER NOT NULL DEFAULT 0,"
+                " reserved INTEGER NOT NULL DEFAULT 0, incoming INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reservations ("
+                " reservation_id TEXT PRIMARY KEY, order_id INTEGER, lines TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    # ----------------------------
+    # Connexion / transactions
+    # ----------------------------
+    def _conn(self) -> sqlite3.Connection:
+        # Une connexion par thread et par processus (jamais héritée d'un fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_reservation(row) -> Reservation:
+        return Reservation(reservation_id=row[0], order_id=row[1], lines=json.loads(row[2]),
+                           expires_at=row[3], created_at=row[4])
+
+    @staticmethod
+    def _apply(conn, lines: Dict[str, int], consume: bool) -> None:
+        for sku, qty in lines.items():
+            conn.execute(
+                "UPDATE stock SET reserved = reserved - ?, on_hand = on_hand - ? WHERE sku = ?",
+                (qty, qty if consume else 0, sku),
+            )
+
+    # ----------------------------
+    # Stock
+    # ----------------------------
+    def seed_stock(self, stock: Dict[str, int]) -> None:
+        """Stock initial, sans écraser un état déjà persisté."""
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO stock (sku, on_hand) VALUES (?, ?)", stock.items())
+
+    def set_stock(self, sku: str, on_hand: int) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO stock (sku, on_hand) VALUES (?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET on_hand = excluded.on_hand",
+                (sku, on_hand),
+            )
+
+    def order_stock(self, sku: str, qty: int) -> int:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO stock (sku, incoming) VALUES (?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET incoming = incoming + excluded.incoming",
+                (sku, qty),
+            )
+            return conn.execute("SELECT incoming FROM stock WHERE sku = ?", (sku,)).fetchone()[0]
+
+    def receive_stock(self, sku: str, qty: int) -> int:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO stock (sku) VALUES (?)", (sku,))
+            conn.execute(
+                "UPDATE stock SET on_hand = on_hand + ?, incoming = MAX(0, incoming - ?) WHERE sku = ?",
+                (qty, qty, sku),
+            )
+            return conn.execute("SELECT on_hand - reserved FROM stock WHERE sku = ?", (sku,)).fetchone()[0]
+
+    def get_level(self, sku: str) -> StockLevel:
+        row = self._conn().execute(
+            "SELECT on_hand, reserved, incoming FROM stock WHERE sku = ?", (sku,)
+        ).fetchone()
+        return StockLevel(*row) if row else StockLevel()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        rows = self._conn().execute("SELECT sku, on_hand, reserved, incoming FROM stock").fetchall()
+        return {
+            sku: {"on_hand": on_hand, "reserved": reserved, "available": on_hand - reserved, "incoming": incoming}
+            for sku, on_hand, reserved, incoming in rows
+        }
+
+    # ----------------------------
+    # Réservations
+    # ----------------------------
+    def reserve(self, sku: str, qty: int, order_id: Optional[int] = None,
+                ttl_seconds: Optional[float] = None) -> Reservation:
+        return self.reserve_batch({sku: qty}, order_id=order_id, ttl_seconds=ttl_seconds)
+
+    def reserve_batch(self, lines: Dict[str, int], order_id: Optional[int] = None,
+                      ttl_seconds: Optional[float] = None) -> Reservation:
+        """Réserve toutes les lignes d'une commande, ou aucune."""
+        if not lines:
+            raise ReservationError("Nothing to reserve")
+        if any(qty <= 0 for qty in lines.values()):
+            raise ReservationError("Reserved quantities must be positive")
+
+        ttl = self._ttl if ttl_seconds is None else ttl_seconds
+        reservation = Reservation(
+            reservation_id=f"RES-{uuid.uuid4().hex[:12]}",
+            lines=dict(lines),
+            expires_at=time.time() + ttl,
+            order_id=order_id,
+        )
+        with self._transaction() as conn:
+            shortages = {}
+            for sku, qty in lines.items():
+                row = conn.execute("SELECT on_hand - reserved FROM stock WHERE sku = ?", (sku,)).fetchone()
+                available = row[0] if row else 0
+                if available < qty:
+                    shortages[sku] = available
+            if shortages:
+                raise ReservationError(f"Insufficient stock: {shortages}")
+            for sku, qty in lines.items():
+                conn.execute("UPDATE stock SET reserved = reserved + ? WHERE sku = ?", (qty, sku))
+            conn.execute(
+                "INSERT INTO reservations VALUES (?, ?, ?, ?, ?)",
+                (reservation.reservation_id, order_id, json.dumps(reservation.lines),
+                 reservation.expires_at, reservation.created_at),
+            )
+        return reservation
+
+    def _finish(self, reservation_id: str, consume: bool) -> Reservation:
+        expired = False
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT reservation_id, order_id, lines, expires_at, created_at "
+                "FROM reservations WHERE reservation_id = ?",
+                (reservation_id,),
+            ).fetchone()
+            if row is None:
+                raise ReservationError(f"Unknown or expired reservation: {reservation_id}")
+            reservation = self._row_to_reservation(row)
+            conn.execute("DELETE FROM reservations WHERE reservation_id = ?", (reservation_id,))
+            # Expirée mais pas encore balayée : on la libère au lieu de la confirmer
+            expired = consume and reservation.expires_at <= time.time()
+            self._apply(conn, reservation.lines, consume=consume and not expired)
+        if expired:
+            raise ReservationError(f"Reservation expired: {reservation_id}")
+        return reservation
+
+    def commit(self, reservation_id: str) -> Reservation:
+        return self._finish(reservation_id, consume=True)
+
+    def release(self, reservation_id: str) -> Reservation:
+        return self._finish(reservation_id, consume=False)
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT reservation_id, order_id, lines, expires_at, created_at "
+                "FROM reservations WHERE expires_at <= ?",
+                (now,),
+            ).fetchall()
+            for row in rows:
+                reservation = self._row_to_reservation(row)
+                conn.execute("DELETE FROM reservations WHERE reservation_id = ?", (reservation.reservation_id,))
+                self._apply(conn, reservation.lines, consume=False)
+        return [row[0] for row in rows]
+
+    def get_reservation(self, reservation_id: str) -> Optional[Reservation]:
+        row = self._conn().execute(
+            "SELECT reservation_id, order_id, lines, expires_at, created_at "
+            "FROM reservations WHERE reservation_id = ?",
+            (reservation_id,),
+        ).fetchone()
+        return self._row_to_reservation(row) if row else None
+
+
+# =============================
+# Instance partagée (tools + API)
+# =============================
+def _build_default_engine():
+    # Plusieurs workers (DJUST_WORKERS > 1) ou INVENTORY_DB_PATH : état partagé en SQLite
+    db_path = os.getenv("INVENTORY_DB_PATH")
+    if db_path or int(os.getenv("DJUST_WORKERS", "1")) > 1:
+        engine = SqliteInventoryEngine(db_path or DEFAULT_DB_PATH)
+        engine.seed_stock(DEFAULT_STOCK)
+        return engine
+    engine = InventoryReservationEngine()
+    for sku, qty in DEFAULT_STOCK.items():
+        engine.set_stock(sku, qty)
+    return engine
+
+
+inventory_engine = _build_default_engine()
+
+
+def start_expiry_sweeper(engine=inventory_engine,
+                         interval_seconds: float = 30.0) -> Tuple[threading.Thread, threading.Event]:
+    """Lance un thread démon qui libère périodiquement les réservations expirées."""
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_seconds):
+            # Une erreur ponctuelle (ex. "database is locked") ne doit pas arrêter le sweeper
+            try:
+                engine.expire()
+            except Exception as e:
+                print(f"[⚠️] Libération des réservations expirées échouée ({e})")
+
+    thread = threading.Thread(target=_loop, name="inventory-expiry", daemon=True)
+    thread.start()
+    return thread, stop
+
+
+def reservation_to_dict(reservation: Reservation) -> Dict[str, Any]:
+    return {
+        "reservation_id": reservation.reservation_id,
+        "order_id": reservation.order_id,
+        "lines": reservation.lines,
+        "expires_at": reservation.expires_at,
+    }
@@ -0,0 +1,334 @@
+# =============================
+# jobs.py - File de jobs persistante pour les runs longs (Team / Coordinator)
+# =============================
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Dict, Any, Callable, Optional
+
+
+# ----------------------------
+# Paramètres
+# ----------------------------
+DEFAULT_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.sqlite3"),
+)
+DEFAULT_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+DEFAULT_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "200"))
+CALLBACK_TIMEOUT_SECONDS = 10
+# Hôtes autorisés pour callback_url (séparés par des virgules) ; vide = callbacks désactivés
+CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("JOBS_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+CALLBACK_SCHEMES = ("http", "https")
+
+# Plus la valeur est petite, plus le job est prioritaire
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+
+INTERRUPTED_ERROR = "interrupted: the server stopped while the job was running, resubmit it"
+
+
+class QueueFullError(Exception):
+    """Levée lorsque la file a atteint sa profondeur maximale."""
+
+
+class UnknownTargetError(Exception):
+    """Levée lorsqu'aucun runner n'est enregistré pour la cible demandée."""
+
+
+class InvalidJobError(ValueError):
+    """Levée pour une priorité hors bornes ou un callback_url non autorisé."""
+
+
+def validate_callback_url(url: str) -> None:
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in CALLBACK_SCHEMES:
+        raise InvalidJobError(f"callback_url scheme must be one of {CALLBACK_SCHEMES}")
+    if (parsed.hostname or "").lower() not in CALLBACK_ALLOWED_HOSTS:
+        raise InvalidJobError(f"callback_url host '{parsed.hostname}' is not allowed")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Une redirection permettrait de contourner la liste d'hôtes autorisés
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def serialize_result(result: Any) -> Any:
+    """Convertit un RunOutput agno (ou autre) en structure JSON."""
+    if hasattr(result, "to_dict"):
+        try:
+            return json.loads(json.dumps(result.to_dict(), default=str))
+        except Exception:
+            pass
+    if hasattr(result, "content"):
+        return {"content": result.content}
+    try:
+        return json.loads(json.dumps(result, default=str))
+    except Exception:
+        return str(result)
+
+
+# =============================
+# Stockage SQLite
+# =============================
+class _JobStore:
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                target TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                callback_url TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                worker_pid INTEGER
+            )
+            """
+        )
+        # Bases créées avant l'ajout de worker_pid
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "worker_pid" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Une connexion par processus : ne jamais réutiliser celle héritée d'un fork
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA busy_timeout=5000")
+            self._pid = os.getpid()
+        return self._connection
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, target, payload, priority, status, callback_url, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job["job_id"], job["target"], json.dumps(job["payload"]), job["priority"],
+                 job["status"], job["callback_url"], job["created_at"]),
+            )
+
+    def claim(self, job_id: str) -> bool:
+        """Passe atomiquement un job QUEUED à RUNNING (plusieurs processus peuvent le voir)."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ? WHERE job_id = ? AND status = ?",
+                (STATUS_RUNNING, time.time(), os.getpid(), job_id, STATUS_QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def fail_running(self, error: str, worker_pid: Optional[int] = None) -> int:
+        query = "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?"
+        params = [STATUS_FAILED, error, time.time(), STATUS_RUNNING]
+        if worker_pid is not None:
+            query += " AND worker_pid = ?"
+            params.append(worker_pid)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        return cursor.rowcount
+
+    def count_queued(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_QUEUED,)
+            ).fetchone()[0]
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], default=str)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def queued(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY priority, created_at",
+                (STATUS_QUEUED,),
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+
+# =============================
+# File de jobs
+# =============================
+class JobQueue:
+    """
+    File à priorités servie par un pool borné de threads.
+    Les jobs sont persistés en SQLite : start() reprend les jobs QUEUED.
+    Un job RUNNING interrompu par un arrêt n'est jamais relancé (ses outils,
+    ex. call_djust_pay, ont pu s'exécuter) : recover() le passe en FAILED
+    "interrupted" et le client le resoumet explicitement.
+    En mode pré-forké, claim() garantit qu'un job n'est exécuté que par un
+    seul worker et note son pid : le maître appelle recover() au démarrage,
+    puis recover(worker_pid=pid) pour chaque worker mort qu'il remplace.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, workers: int = DEFAULT_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self._store = _JobStore(db_path)
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._runners: Dict[str, Callable[[Any], Any]] = {}
+        self._workers = max(1, workers)
+        self._max_pending = max_pending
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+
+    def register(self, target: str, runner: Callable[[Any], Any]) -> None:
+        self._runners[target] = runner
+
+    # ----------------------------
+    # Cycle de vie
+    # ----------------------------
+    def recover(self, worker_pid: Optional[int] = None) -> int:
+        """Passe en FAILED les jobs RUNNING (tous, ou ceux du processus `worker_pid`)."""
+        return self._store.fail_running(INTERRUPTED_ERROR, worker_pid)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for job in self._store.queued():
+            self._enqueue(job["priority"], job["job_id"])
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for _ in self._threads:
+            self._queue.put((float("inf"), 0, None))
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    # ----------------------------
+    # API publique
+    # ----------------------------
+    def submit(self, target: str, payload: Any, priority: int = PRIORITY_NORMAL,
+               callback_url: Optional[str] = None) -> Dict[str, Any]:
+        if target not in self._runners:
+            raise UnknownTargetError(f"No runner registered for '{target}'")
+        if not PRIORITY_HIGH <= priority <= PRIORITY_LOW:
+            raise InvalidJobError(f"priority must be between {PRIORITY_HIGH} and {PRIORITY_LOW}")
+        if callback_url:
+            validate_callback_url(callback_url)
+        # Compté en base : la file mémoire peut contenir des doublons en mode pré-forké
+        if self._store.count_queued() >= self._max_pending:
+            raise QueueFullError(f"Job queue is full ({self._max_pending} pending)")
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "target": target,
+            "payload": payload,
+            "priority": priority,
+            "status": STATUS_QUEUED,
+            "callback_url": callback_url,
+            "created_at": time.time(),
+        }
+        self._store.insert(job)
+        self._enqueue(priority, job["job_id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._store.get(job_id)
+
+    def pending(self) -> int:
+        return self._store.count_queued()
+
+    # ----------------------------
+    # Internes
+    # ----------------------------
+    def _enqueue(self, priority: int, job_id: str) -> None:
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        self._queue.put((priority, seq, job_id))
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            # Une erreur SQLite (ex. "database is locked") ne doit pas tuer le thread
+            try:
+                self._process(job_id)
+            except Exception as e:
+                print(f"[⚠️] Job {job_id} : erreur de la file ({e})")
+
+    def _process(self, job_id: str) -> None:
+        if not self._store.claim(job_id):
+            return
+        try:
+            job = self._store.get(job_id)
+            result = serialize_result(self._runners[job["target"]](job["payload"]))
+            self._store.update(job_id, status=STATUS_DONE, result=result, finished_at=time.time())
+        except Exception as e:
+            # Job réclamé : il ne doit pas rester RUNNING
+            self._store.update(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+        job = self._store.get(job_id)
+        if job["callback_url"]:
+            self._deliver_callback(job)
+
+    @staticmethod
+    def _deliver_callback(job: Dict[str, Any]) -> None:
+        try:
+            validate_callback_url(job["callback_url"])
+        except InvalidJobError as e:
+            print(f"[⚠️] Callback refusé pour le job {job['job_id']} ({e})")
+            return
+        body = json.dumps(
+            {key: job[key] for key in ("job_id", "target", "status", "result", "error")},
+            default=str,
+        ).encode("utf-8")
+        request = urllib.request.Request(
+            job["callback_url"], data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            _callback_opener.open(request, timeout=CALLBACK_TIMEOUT_SECONDS).close()
+        except Exception as e:
+            print(f"[⚠️] Callback échoué pour le job {job['job_id']} ({e})")
@@ -0,0 +1,330 @@
+# =============================
+# retrieval.py - Recherche hybride BM25 + vecteur pour la Knowledge Base
+# =============================
+import contextlib
+import contextvars
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# ----------------------------
+# Paramètres
+# ----------------------------
+DOCUMENTS_DIR = Path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+# Un hit BM25 est jugé "sûr" s'il dépasse ce score et domine les autres documents
+BM25_CONFIDENT_SCORE = float(os.getenv("BM25_CONFIDENT_SCORE", "2.0"))
+BM25_CONFIDENT_RATIO = float(os.getenv("BM25_CONFIDENT_RATIO", "1.5"))
+RRF_K = 60
+
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "de", "du", "d", "l", "et", "ou", "en", "a", "au", "aux",
+    "pour", "par", "sur", "dans", "avec", "ce", "cette", "ces", "est", "sont", "qui", "que", "se",
+    "the", "an", "of", "to", "and", "or", "in", "on", "for", "is", "are", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscules, sans accents, mots alphanumériques hors mots vides."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in re.findall(r"[a-z0-9]+", text) if token not in STOPWORDS]
+
+
+def normalize_text(text: str) -> str:
+    """Forme comparable d'un passage, indépendante du découpage (titres, espaces, accents)."""
+    return " ".join(tokenize(re.sub(r"^#+ .*$", "", text, flags=re.MULTILINE)))
+
+
+def source_key(name: Optional[str]) -> str:
+    """Nom de fichier sans extension : commun aux chunks BM25 et aux documents ingérés."""
+    return Path(str(name or "")).stem.lower()
+
+
+def chunk_markdown(path: Path) -> List[Dict[str, Any]]:
+    """Découpe un document markdown par section `## ` (titre du document conservé)."""
+    text = path.read_text(encoding="utf-8")
+    title_match = re.search(r"^# (.+)$", text, flags=re.MULTILINE)
+    title = title_match.group(1).strip() if title_match else path.stem
+    chunks = []
+    for index, section in enumerate(re.split(r"^(?=## )", text, flags=re.MULTILINE)):
+        section = section.strip()
+        if not section:
+            continue
+        content = section if section.startswith("# ") else f"# {title}\n{section}"
+        chunks.append({
+            "id": f"{path.stem}#{index}",
+            "name": path.stem,
+            "content": content,
+            "meta_data": {"source": path.name, "title": title, "chunk": index},
+        })
+    return chunks
+
+
+# =============================
+# Index BM25 en mémoire
+# =============================
+class BM25Index:
+    def __init__(self, chunks: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._tfs = [Counter(tokenize(chunk["content"])) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tfs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        df = Counter(term for tf in self._tfs for term in tf)
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    @classmethod
+    def from_directory(cls, directory: Path = DOCUMENTS_DIR) -> "BM25Index":
+        chunks = [chunk for path in sorted(directory.glob("*.md")) for chunk in chunk_markdown(path)]
+        return cls(chunks)
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        if not terms:
+            return []
+        scores = []
+        for i, tf in enumerate(self._tfs):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((i, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return [(self.chunks[i], score) for i, score in scores[:limit]]
+
+
+# =============================
+# Cache LRU des embeddings de requête
+# =============================
+_query_scope: contextvars.ContextVar = contextvars.ContextVar("query_embedding_scope", default=False)
+
+
+class EmbeddingCache:
+    """
+    Mémorise get_embedding / get_embedding_and_usage d'un embedder agno par texte,
+    uniquement dans un bloc query_scope() : les embeddings de documents calculés
+    à l'ingestion ne passent ni par le cache ni par les compteurs.
+    """
+
+    def __init__(self, embedder, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.embedder = embedder
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True, self._cache[key]
+            self.misses += 1
+            return False, None
+
+    def _put(self, key, value) -> None:
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def query_scope():
+        token = _query_scope.set(True)
+        try:
+            yield
+        finally:
+            _query_scope.reset(token)
+
+    def _wrap(self, method: str):
+        fn = getattr(self.embedder, method, None)
+        if fn is None:
+            return
+
+        if method.startswith("async_"):
+            async def wrapper(text: str):
+                if not _query_scope.get():
+                    return await fn(text)
+                found, value = self._get((method, text))
+                if not found:
+                    value = await fn(text)
+                    self._put((method, text), value)
+                return value
+        else:
+            def wrapper(text: str):
+                if not _query_scope.get():
+                    return fn(text)
+                found, value = self._get((method, text))
+                if not found:
+                    value = fn(text)
+                    self._put((method, text), value)
+                return value
+
+        object.__setattr__(self.embedder, method, wrapper)
+
+    def install(self) -> "EmbeddingCache":
+        for method in ("get_embedding", "get_embedding_and_usage",
+                       "async_get_embedding", "async_get_embedding_and_usage"):
+            self._wrap(method)
+        return self
+
+
+# =============================
+# Retriever hybride
+# =============================
+class HybridRetriever:
+    """
+    Remplace Knowledge.search : un hit BM25 sûr répond sans aucun appel
+    d'embedding ; sinon les résultats vecteur (embedding en cache LRU) sont
+    fusionnés avec BM25 par Reciprocal Rank Fusion.
+    """
+
+    def __init__(self, knowledge, index: Optional[BM25Index] = None):
+        self.knowledge = knowledge
+        self.index = index or BM25Index.from_directory()
+        embedder = getattr(getattr(knowledge, "vector_db", None), "embedder", None)
+        self.embedding_cache = EmbeddingCache(embedder).install() if embedder is not None else None
+        self._vector_search = knowledge.search
+        self._async_vector_search = getattr(knowledge, "async_search", None)
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "keyword_only": 0, "hybrid": 0, "total_ms": 0.0}
+
+    def reload(self, chunks: List[Dict[str, Any]]) -> None:
+        """Remplace l'index BM25 (ex. corpus publié dans le snapshot partagé)."""
+        self.index = BM25Index(chunks)
+
+    def install(self) -> "HybridRetriever":
+        object.__setattr__(self.knowledge, "search", self.search)
+        if self._async_vector_search is not None:
+            object.__setattr__(self.knowledge, "async_search", self.async_search)
+        return self
+
+    # ----------------------------
+    # Helpers
+    # ----------------------------
+    @staticmethod
+    def _to_document(chunk: Dict[str, Any]):
+        from agno.knowledge.document import Document
+
+        return Document(id=chunk["id"], name=chunk["name"], content=chunk["content"],
+                        meta_data=dict(chunk["meta_data"]))
+
+    @staticmethod
+    def _is_confident(hits: List[Tuple[Dict[str, Any], float]]) -> bool:
+        # Le meilleur document doit dominer le meilleur résultat d'un autre document
+        if not hits or hits[0][1] < BM25_CONFIDENT_SCORE:
+            return False
+        top_source = hits[0][0]["meta_data"]["source"]
+        runner_up = next((score for chunk, score in hits if chunk["meta_data"]["source"] != top_source), 0.0)
+        return hits[0][1] >= BM25_CONFIDENT_RATIO * runner_up
+
+    @staticmethod
+    def _vector_source(doc) -> str:
+        meta = getattr(doc, "meta_data", None) or {}
+        for key in ("source", "file_name", "file_path", "path", "name"):
+            if meta.get(key):
+                return source_key(meta[key])
+        return source_key(getattr(doc, "name", None))
+
+    def _fuse(self, hits, vector_docs, limit: int):
+        """
+        RRF au niveau du document source (les découpages BM25 et MarkdownReader
+        diffèrent, les passages ne coïncident pas), puis, par source, les passages
+        vecteur suivis des passages BM25 qu'ils ne contiennent pas déjà.
+        """
+        scores: Dict[str, float] = {}
+        vector_passages: Dict[str, List[Tuple[str, Any]]] = {}
+        bm25_passages: Dict[str, List[Tuple[str, Any]]] = {}
+        for doc in vector_docs or []:
+            source = self._vector_source(doc)
+            if source not in vector_passages:
+                scores[source] = scores.get(source, 0.0) + 1.0 / (RRF_K + len(vector_passages) + 1)
+            vector_passages.setdefault(source, []).append((normalize_text(doc.content or ""), doc))
+        for chunk, _ in hits:
+            source = source_key(chunk["meta_data"]["source"])
+            if source not in bm25_passages:
+                scores[source] = scores.get(source, 0.0) + 1.0 / (RRF_K + len(bm25_passages) + 1)
+            bm25_passages.setdefault(source, []).append((normalize_text(chunk["content"]), chunk))
+
+        results, kept = [], []
+        for source in sorted(scores, key=scores.get, reverse=True):
+            # Vecteur d'abord : ses passages sont ceux réellement ingérés
+            candidates = vector_passages.get(source, []) + bm25_passages.get(source, [])
+            for key, item in candidates:
+                if not key or any(key in other or other in key for other in kept):
+                    continue
+                kept.append(key)
+                results.append(self._to_document(item) if isinstance(item, dict) else item)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _record(self, started: float, keyword_only: bool) -> None:
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["keyword_only" if keyword_only else "hybrid"] += 1
+            self.stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+    def _limit(self, max_results: Optional[int]) -> int:
+        return max_results or getattr(self.knowledge, "max_results", None) or 5
+
+    # ----------------------------
+    # Recherche
+    # ----------------------------
+    def search(self, query: str, max_results: Optional[int] = None, filters=None, **kwargs):
+        started = time.perf_counter()
+        limit = self._limit(max_results)
+        hits = self.index.search(query, limit) if not filters else []
+        if self._is_confident(hits):
+            self._record(started, keyword_only=True)
+            return [self._to_document(chunk) for chunk, _ in hits]
+        with EmbeddingCache.query_scope():
+            vector_docs = self._vector_search(query, max_results=limit, filters=filters, **kwargs)
+        self._record(started, keyword_only=False)
+        return self._fuse(hits, vector_docs, limit)
+
+    async def async_search(self, query: str, max_results: Optional[int] = None, filters=None, **kwargs):
+        started = time.perf_counter()
+        limit = self._limit(max_results)
+        hits = self.index.search(query, limit) if not filters else []
+        if self._is_confident(hits):
+            self._record(started, keyword_only=True)
+            return [self._to_document(chunk) for chunk, _ in hits]
+        with EmbeddingCache.query_scope():
+            vector_docs = await self._async_vector_search(query, max_results=limit, filters=filters, **kwargs)
+        self._record(started, keyword_only=False)
+        return self._fuse(hits, vector_docs, limit)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        queries = stats.pop("queries")
+        total_ms = stats.pop("total_ms")
+        cache = self.embedding_cache
+        return {
+            "queries": queries,
+            **stats,
+            "avg_latency_ms": round(total_ms / queries, 2) if queries else 0.0,
+            "bm25_chunks": len(self.index.chunks),
+            "embedding_cache": {
+                "size": len(cache._cache) if cache else 0,
+                "hits": cache.hits if cache else 0,
+                "embedding_calls": cache.misses if cache else 0,
+            },
+        }
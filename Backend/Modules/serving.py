@@ -0,0 +1,120 @@
+# =============================
+# serving.py - Mode production pré-forké (N workers uvicorn, un socket partagé)
+# =============================
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+WORKER_ENV = "DJUST_WORKER_ID"
+
+
+def is_prefork_worker() -> bool:
+    return os.getenv(WORKER_ENV) is not None
+
+
+def _run_worker(app, sock: socket.socket, worker_id: int, log_level: str,
+                on_worker_start: Optional[Callable[[int], None]] = None) -> None:
+    import uvicorn
+
+    os.environ[WORKER_ENV] = str(worker_id)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if on_worker_start is not None:
+        on_worker_start(worker_id)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_prefork(app, host: str = "0.0.0.0", port: int = 8000, workers: int = 2,
+                  refresh: Optional[Callable[[], None]] = None, refresh_interval: float = 30.0,
+                  on_worker_start: Optional[Callable[[int], None]] = None,
+                  on_worker_stop: Optional[Callable[[int], None]] = None,
+                  on_worker_exit: Optional[Callable[[int], None]] = None,
+                  log_level: str = "info") -> None:
+    """
+    Le maître a déjà importé l'application (agents, modèles, données) : les
+    workers sont forkés ensuite et partagent ces pages en copy-on-write.
+    Le maître surveille les workers (relance en cas de crash) et appelle
+    `refresh` périodiquement pour republier le snapshot partagé.
+
+    Hooks :
+    - on_worker_start(worker_id) / on_worker_stop(worker_id) : dans le worker,
+      avant le serveur et avant os._exit (les handlers atexit ne sont pas appelés) ;
+    - on_worker_exit(pid) : dans le maître, pour chaque worker récupéré par
+      waitpid (crash ou arrêt), avant sa relance.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def reaped(pid: int) -> None:
+        if on_worker_exit is not None:
+            try:
+                on_worker_exit(pid)
+            except Exception as e:
+                print(f"[⚠️] Nettoyage du worker pid {pid} échoué ({e})")
+
+    def spawn(worker_id: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, worker_id, log_level, on_worker_start)
+            finally:
+                if on_worker_stop is not None:
+                    try:
+                        on_worker_stop(worker_id)
+                    except Exception as e:
+                        print(f"[⚠️] Arrêt du worker {worker_id} incomplet ({e})")
+                os._exit(0)
+        children[pid] = worker_id
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+    print(f"🚀 {workers} workers pré-forkés sur {host}:{port} (maître pid {os.getpid()})")
+
+    next_refresh = time.monotonic() + refresh_interval
+    try:
+        while not stopping:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in children:
+                worker_id = children.pop(pid)
+                print(f"[⚠️] Worker {worker_id} (pid {pid}) arrêté, relance.")
+                reaped(pid)
+                spawn(worker_id)
+            if refresh is not None and time.monotonic() >= next_refresh:
+                try:
+                    refresh()
+                except Exception as e:
+                    print(f"[⚠️] Publication du snapshot échouée ({e})")
+                next_refresh = time.monotonic() + refresh_interval
+            time.sleep(0.5)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            reaped(pid)
+        sock.close()
@@ -0,0 +1,302 @@
+# =============================
+# snapshot.py - Read-model partagé entre workers (mémoire partagée)
+# =============================
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+
+# ----------------------------
+# Format
+# ----------------------------
+# Segment de contrôle : seqlock, génération, nom du segment de données courant
+CONTROL_FORMAT = "<QQ64s"
+CONTROL_SIZE = struct.calcsize(CONTROL_FORMAT)
+
+# Segment de données : en-tête, index des sections, puis sections.
+# Une section JSON n'est décodée qu'à la demande. La section stock est une
+# table d'enregistrements fixes triés par SKU (octets UTF-8), suivie des SKU
+# eux-mêmes : chaque enregistrement pointe sur sa clé (longueur quelconque).
+DATA_MAGIC = b"DJRM"
+DATA_HEADER = "<4sI"
+INDEX_ENTRY = "<32sBxxxIQQ"  # nom, type, crc32, offset, longueur
+STOCK_HEADER = "<I"          # nombre d'enregistrements
+STOCK_RECORD = "<IIqqqq"     # offset du SKU (relatif à la section), longueur, on_hand, reserved, available, incoming
+DATA_HEADER_SIZE = struct.calcsize(DATA_HEADER)
+STOCK_HEADER_SIZE = struct.calcsize(STOCK_HEADER)
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY)
+STOCK_RECORD_SIZE = struct.calcsize(STOCK_RECORD)
+STOCK_FIELDS = ("on_hand", "reserved", "available", "incoming")
+
+KIND_JSON = 0
+KIND_STOCK = 1
+STOCK_SECTIONS = {"inventory"}
+
+SNAPSHOT_ENV = "DJUST_SNAPSHOT_NAME"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Ouvre un segment existant sans le confier au resource_tracker (seul l'éditeur le supprime)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(segment: shared_memory.SharedMemory) -> None:
+    # Un worker forké partage le resource_tracker du maître : son unregister() a pu
+    # retirer l'enregistrement, on le rétablit pour que unlink() reste cohérent.
+    try:
+        resource_tracker.register(segment._name, "shared_memory")
+    except Exception:
+        pass
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _encode_stock(levels: Dict[str, Dict[str, int]]) -> bytes:
+    items = sorted((sku.encode("utf-8"), level) for sku, level in levels.items())
+    key_offset = STOCK_HEADER_SIZE + STOCK_RECORD_SIZE * len(items)
+    records = [struct.pack(STOCK_HEADER, len(items))]
+    for key, level in items:
+        records.append(struct.pack(STOCK_RECORD, key_offset, len(key), *(int(level[f]) for f in STOCK_FIELDS)))
+        key_offset += len(key)
+    return b"".join(records + [key for key, _ in items])
+
+
+def encode_section(name: str, value: Any) -> Tuple[int, bytes]:
+    """(type, octets) d'une section, tels que publiés."""
+    if name in STOCK_SECTIONS:
+        return KIND_STOCK, _encode_stock(value)
+    return KIND_JSON, json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def section_crc(name: str, value: Any) -> int:
+    """crc32 qu'aurait la section `name` publiée avec cette valeur."""
+    return zlib.crc32(encode_section(name, value)[1])
+
+
+def _encode_sections(read_model: Dict[str, Any]) -> bytes:
+    sections: List[Tuple[str, int, bytes]] = [
+        (name, *encode_section(name, value)) for name, value in read_model.items()
+    ]
+
+    offset = DATA_HEADER_SIZE + INDEX_ENTRY_SIZE * len(sections)
+    header = [struct.pack(DATA_HEADER, DATA_MAGIC, len(sections))]
+    for name, kind, payload in sections:
+        header.append(struct.pack(INDEX_ENTRY, name.encode("ascii"), kind, zlib.crc32(payload), offset, len(payload)))
+        offset += len(payload)
+    return b"".join(header + [payload for _, _, payload in sections])
+
+
+# =============================
+# Éditeur (processus maître)
+# =============================
+class SnapshotPublisher:
+    """
+    Publie le read-model dans un nouveau segment à chaque génération, puis
+    bascule le pointeur du segment de contrôle sous seqlock : les lecteurs
+    voient toujours une génération complète. La génération précédente est
+    conservée jusqu'à la suivante pour les lecteurs en cours de bascule.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name or f"djust_rm_{os.getpid()}"
+        self._control = shared_memory.SharedMemory(name=f"{self.name}_ctl", create=True, size=CONTROL_SIZE)
+        struct.pack_into(CONTROL_FORMAT, self._control.buf, 0, 0, 0, b"")
+        self._segments: List[shared_memory.SharedMemory] = []
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def publish(self, read_model: Dict[str, Any]) -> int:
+        payload = _encode_sections(read_model)
+        with self._lock:
+            generation = self._generation + 1
+            segment_name = f"{self.name}_{generation}"
+            segment = shared_memory.SharedMemory(name=segment_name, create=True, size=len(payload))
+            segment.buf[:len(payload)] = payload
+
+            seq = struct.unpack_from("<Q", self._control.buf, 0)[0]
+            struct.pack_into("<Q", self._control.buf, 0, seq + 1)
+            struct.pack_into("<Q64s", self._control.buf, 8, generation, segment_name.encode("ascii"))
+            struct.pack_into("<Q", self._control.buf, 0, seq + 2)
+
+            self._generation = generation
+            self._segments.append(segment)
+            while len(self._segments) > 2:
+                _unlink(self._segments.pop(0))
+        return generation
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments + [self._control]:
+                _unlink(segment)
+            self._segments = []
+
+
+# =============================
+# Vue d'une génération
+# =============================
+class _Generation:
+    def __init__(self, number: int, segment: shared_memory.SharedMemory):
+        self.number = number
+        self.segment = segment
+        magic, count = struct.unpack_from(DATA_HEADER, segment.buf, 0)
+        if magic != DATA_MAGIC:
+            raise ValueError("Invalid snapshot segment")
+        self.index: Dict[str, Tuple[int, int, int, int]] = {}
+        for i in range(count):
+            raw_name, kind, crc, offset, length = struct.unpack_from(
+                INDEX_ENTRY, segment.buf, DATA_HEADER_SIZE + i * INDEX_ENTRY_SIZE
+            )
+            self.index[raw_name.rstrip(b"\x00").decode("ascii")] = (kind, crc, offset, length)
+        self.decoded: Dict[str, Any] = {}
+
+    def json_section(self, name: str) -> Any:
+        if name not in self.decoded:
+            _, _, offset, length = self.index[name]
+            self.decoded[name] = json.loads(bytes(self.segment.buf[offset:offset + length]))
+        return self.decoded[name]
+
+    def stock_key(self, name: str, position: int) -> bytes:
+        _, _, offset, _ = self.index[name]
+        key_offset, key_length = struct.unpack_from(
+            "<II", self.segment.buf, offset + STOCK_HEADER_SIZE + position * STOCK_RECORD_SIZE
+        )
+        return bytes(self.segment.buf[offset + key_offset:offset + key_offset + key_length])
+
+    def stock_record(self, name: str, position: int) -> Tuple[str, Dict[str, int]]:
+        _, _, offset, _ = self.index[name]
+        _, _, *values = struct.unpack_from(
+            STOCK_RECORD, self.segment.buf, offset + STOCK_HEADER_SIZE + position * STOCK_RECORD_SIZE
+        )
+        return self.stock_key(name, position).decode("utf-8"), dict(zip(STOCK_FIELDS, values))
+
+    def stock_count(self, name: str) -> int:
+        return struct.unpack_from(STOCK_HEADER, self.segment.buf, self.index[name][2])[0]
+
+
+# =============================
+# Lecteur (workers)
+# =============================
+class SnapshotReader:
+    """
+    Mappe le segment courant sans le copier. Les lectures de stock se font
+    directement dans le buffer (recherche dichotomique sur les enregistrements
+    fixes) ; une section JSON n'est décodée que si elle est lue, une fois par
+    génération. Un callback on_refresh n'est appelé que si le crc publié de sa
+    section diffère de celui des données qu'il a déjà (`crc`, puis dernier appel).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._control = _attach(f"{name}_ctl")
+        self._current: Optional[_Generation] = None
+        self._previous: Optional[_Generation] = None
+        self._lock = threading.Lock()
+        self._callbacks: List[List[Any]] = []
+
+    @classmethod
+    def from_env(cls) -> Optional["SnapshotReader"]:
+        name = os.getenv(SNAPSHOT_ENV)
+        if not name:
+            return None
+        try:
+            return cls(name)
+        except FileNotFoundError:
+            return None
+
+    def on_refresh(self, section: str, callback: Callable[[Any], None], crc: Optional[int] = None) -> None:
+        """`crc` : section_crc() des données déjà chargées (ex. préchargées avant le fork)."""
+        self._callbacks.append([section, callback, crc])
+
+    def _read_control(self):
+        while True:
+            seq = struct.unpack_from("<Q", self._control.buf, 0)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            generation, raw_name = struct.unpack_from("<Q64s", self._control.buf, 8)
+            if struct.unpack_from("<Q", self._control.buf, 0)[0] == seq:
+                return generation, raw_name.rstrip(b"\x00").decode("ascii")
+
+    def generation(self) -> int:
+        return self._read_control()[0]
+
+    def _refresh(self) -> Optional[_Generation]:
+        number, segment_name = self._read_control()
+        current = self._current
+        if number == 0 or (current is not None and current.number == number):
+            return current
+        with self._lock:
+            if self._current is not None and self._current.number == number:
+                return self._current
+            try:
+                fresh = _Generation(number, _attach(segment_name))
+            except FileNotFoundError:
+                # Génération remplacée entre la lecture du pointeur et l'ouverture
+                return self._current
+            old = self._current
+            # L'avant-dernière génération est fermée ; la précédente reste mappée
+            # pour les lectures encore en cours dans d'autres threads.
+            if self._previous is not None:
+                self._previous.segment.close()
+            self._previous, self._current = old, fresh
+        for entry in self._callbacks:
+            section, callback, known_crc = entry
+            if section in fresh.index and fresh.index[section][1] != known_crc:
+                entry[2] = fresh.index[section][1]
+                callback(self.section(section))
+        return fresh
+
+    def section(self, name: str) -> Any:
+        current = self._refresh()
+        if current is None or name not in current.index:
+            return None
+        if current.index[name][0] == KIND_STOCK:
+            return dict(current.stock_record(name, i) for i in range(current.stock_count(name)))
+        return current.json_section(name)
+
+    def stock_level(self, sku: str, section: str = "inventory") -> Optional[Dict[str, int]]:
+        """Niveau d'un SKU lu directement dans le segment, sans décoder la table."""
+        current = self._refresh()
+        if current is None or section not in current.index:
+            return None
+        key = sku.encode("utf-8")
+        low, high = 0, current.stock_count(section)
+        while low < high:
+            middle = (low + high) // 2
+            found = current.stock_key(section, middle)
+            if found == key:
+                return current.stock_record(section, middle)[1]
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def watch(self, interval_seconds: float = 5.0) -> threading.Thread:
+        """Thread démon qui détecte les nouvelles générations et déclenche on_refresh."""
+
+        def _loop():
+            while True:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    print(f"[⚠️] Snapshot refresh échoué ({e})")
+                time.sleep(interval_seconds)
+
+        thread = threading.Thread(target=_loop, name="snapshot-watch", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from Modules.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    _ProviderGate,
+    admission_lane,
+)
+
+
+def drained_gate(rate=20.0, max_depth=10, max_wait=5.0):
+    gate = _ProviderGate("mistral", rate, 1, max_depth, max_wait)
+    assert gate.bucket.try_acquire()
+    return gate
+
+
+def wait_for_depth(gate, lane, depth):
+    deadline = time.monotonic() + 2
+    while gate.depth[lane] < depth:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_gate_serves_higher_priority_lane_first():
+    gate = drained_gate(rate=5.0)
+    order = []
+
+    def call(lane):
+        gate.acquire(lane)
+        order.append(lane)
+
+    threads = []
+    for lane in ("summary", "intake", "payment"):
+        thread = threading.Thread(target=call, args=(lane,))
+        thread.start()
+        threads.append(thread)
+        wait_for_depth(gate, lane, 1)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["payment", "intake", "summary"]
+
+
+def test_gate_rejects_when_lane_queue_is_full():
+    gate = drained_gate(rate=0.5, max_depth=1, max_wait=1.0)
+    errors = []
+
+    def wait_in_queue():
+        try:
+            gate.acquire("summary")
+        except AdmissionRejected as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait_in_queue)
+    waiter.start()
+    wait_for_depth(gate, "summary", 1)
+    with pytest.raises(AdmissionRejected):
+        gate.acquire("summary")
+    assert gate.rejected["summary"] == 1
+    waiter.join(timeout=5)
+    assert len(errors) == 1  # le premier appel expire ensuite (max_wait=1s)
+
+
+def test_gate_times_out():
+    gate = drained_gate(rate=0.01, max_wait=0.05)
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        gate.acquire("payment")
+    assert time.monotonic() - started < 1
+    assert gate.depth["payment"] == 0
+
+
+def test_admission_lane_max_wait_overrides_default():
+    controller = AdmissionController(provider_limits={"mistral": (0.01, 1)}, max_wait_seconds=0.05)
+    controller.acquire_model_call("mistral", "summary")
+    with admission_lane("summary", max_wait=0.3):
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected):
+            controller.acquire_model_call("mistral")
+        assert time.monotonic() - started >= 0.25
+
+
+def test_wait_p95_uses_upper_rank():
+    controller = AdmissionController(provider_limits={"mistral": (1, 1)})
+    controller._providers["mistral"].waits["payment"] = [0.399, 0.9]
+    lane = controller.metrics()["lanes"]["payment"]
+    assert lane["wait_ms_p95"] == 900.0
+    assert lane["wait_ms_avg"] <= lane["wait_ms_p95"]
+
+
+def test_share_between_workers_splits_rates():
+    controller = AdmissionController(route_limits={"/r": (4.0, 8)}, provider_limits={"mistral": (5.0, 10)})
+    controller.share_between(4)
+    gate = controller._providers["mistral"]
+    assert (gate.bucket.rate, gate.bucket.capacity) == (1.25, 2.5)
+    assert (controller._routes["/r"].rate, controller._routes["/r"].capacity) == (1.0, 2.0)
+    assert [gate.bucket.try_acquire() for _ in range(3)] == [True, True, False]
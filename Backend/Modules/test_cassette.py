@@ -0,0 +1,107 @@
+import dataclasses
+import functools
+import itertools
+
+import pytest
+
+from Modules.cassette import Cassette, CassetteMissError, _decode, _encode
+
+
+@dataclasses.dataclass
+class Receipt:
+    invoice_id: str
+    amount: float
+
+
+class FakeFunction:
+    """Même forme qu'une Function agno : @tool construit `entrypoint` avec functools.wraps."""
+
+    def __init__(self, fn):
+        self.name = fn.__name__
+
+        @functools.wraps(fn)
+        def entrypoint(*args, **kwargs):
+            return fn(*args, **kwargs)
+
+        self.entrypoint = entrypoint
+
+
+class FakeAgent:
+    def __init__(self, tools):
+        self.model = None
+        self.tools = tools
+
+
+def make_tool():
+    counter = itertools.count(1)
+
+    def call_djust_pay(order_id: str, amount: float):
+        return {"order_id": order_id, "invoice_id": f"INV-{next(counter)}", "payload": b"\x00\xff"}
+
+    return FakeFunction(call_djust_pay)
+
+
+def test_encode_decode_round_trip():
+    value = {
+        "text": "é",
+        "numbers": [1, 2.5, None, True],
+        "raw": b"\x00\x01",
+        "business": {"__type__": "not-a-type", "kind": "x"},
+        "nested": ({"a": [b"b"]},),
+    }
+    decoded = _decode(_encode(value))
+    assert decoded["raw"] == b"\x00\x01"
+    assert decoded["business"] == {"__type__": "not-a-type", "kind": "x"}
+    assert decoded["nested"] == [{"a": [b"b"]}]
+    assert decoded["numbers"] == [1, 2.5, None, True]
+
+
+def test_decode_refuses_types_outside_allowlist():
+    encoded = _encode(Receipt("INV-1", 10.0))
+    assert encoded["kind"] == "dataclass"
+    with pytest.raises(CassetteMissError):
+        _decode(encoded)
+
+
+def test_tool_with_wraps_entrypoint_is_recorded_and_replayed(tmp_path):
+    recorder = Cassette(name="tools", mode="record", directory=str(tmp_path))
+    tool = make_tool()
+    recorder.install([FakeAgent([tool])])
+    first = tool.entrypoint("ORD-1", 10.0)
+    second = tool.entrypoint("ORD-1", 10.0)
+    assert (first["invoice_id"], second["invoice_id"]) == ("INV-1", "INV-2")
+    recorder.save()
+
+    player = Cassette(name="tools", mode="replay", directory=str(tmp_path))
+    replayed = make_tool()
+    player.install([FakeAgent([replayed])])
+    player.install([FakeAgent([replayed])])  # réinstallation : pas de double wrapper
+    assert replayed.entrypoint("ORD-1", 10.0) == first
+    assert replayed.entrypoint("ORD-1", 10.0) == second
+    with pytest.raises(CassetteMissError):
+        replayed.entrypoint("ORD-2", 10.0)
+
+
+def test_agno_tool_is_recorded_and_replayed(tmp_path):
+    agno_tools = pytest.importorskip("agno.tools")
+    calls = []
+
+    @agno_tools.tool
+    def notify(message: str) -> str:
+        calls.append(message)
+        return f"sent {len(calls)}"
+
+    recorder = Cassette(name="agno", mode="record", directory=str(tmp_path))
+    recorder.install([FakeAgent([notify])])
+    assert notify.entrypoint(message="hi") == "sent 1"
+    recorder.save()
+
+    player = Cassette(name="agno", mode="replay", directory=str(tmp_path))
+    player.install([FakeAgent([notify])])
+    assert notify.entrypoint(message="hi") == "sent 1"
+    assert calls == ["hi"]
+
+
+def test_replay_without_file_is_a_miss(tmp_path):
+    with pytest.raises(CassetteMissError):
+        Cassette(name="missing", mode="replay", directory=str(tmp_path))
@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Modules.inventory import InventoryReservationEngine, ReservationError, start_expiry_sweeper
+
+
+def make_engine(**stock):
+    engine = InventoryReservationEngine(shards=8)
+    for sku, qty in stock.items():
+        engine.set_stock(sku, qty)
+    return engine
+
+
+def test_concurrent_reserve_batch_never_oversells():
+    engine = make_engine(A=500, B=300)
+    barrier = threading.Barrier(20)
+
+    def worker(_):
+        barrier.wait()
+        ok = 0
+        for _ in range(200):
+            try:
+                engine.reserve_batch({"A": 1, "B": 1})
+                ok += 1
+            except ReservationError:
+                pass
+        return ok
+
+    with ThreadPoolExecutor(20) as pool:
+        reserved = sum(pool.map(worker, range(20)))
+
+    assert reserved == 300
+    assert engine.get_level("A").reserved == 300
+    assert engine.get_level("B").reserved == 300
+    assert engine.get_level("B").available == 0
+
+
+def test_reserve_batch_is_all_or_nothing():
+    engine = make_engine(A=10, B=1)
+    with pytest.raises(ReservationError):
+        engine.reserve_batch({"A": 5, "B": 2})
+    assert engine.get_level("A").reserved == 0
+    assert engine.get_level("B").reserved == 0
+
+
+def test_commit_release_and_expire_accounting():
+    engine = make_engine(A=10)
+    committed = engine.reserve("A", 3)
+    released = engine.reserve("A", 2)
+    expiring = engine.reserve("A", 4, ttl_seconds=-1)
+
+    engine.commit(committed.reservation_id)
+    engine.release(released.reservation_id)
+    assert engine.expire() == [expiring.reservation_id]
+
+    level = engine.get_level("A")
+    assert (level.on_hand, level.reserved, level.available) == (7, 0, 7)
+    with pytest.raises(ReservationError):
+        engine.commit(committed.reservation_id)
+
+
+def test_expired_reservation_cannot_be_committed():
+    engine = make_engine(A=10)
+    reservation = engine.reserve("A", 4, ttl_seconds=-1)
+    with pytest.raises(ReservationError):
+        engine.commit(reservation.reservation_id)
+    level = engine.get_level("A")
+    assert (level.on_hand, level.reserved) == (10, 0)
+
+
+def test_purchase_order_is_not_reservable_until_received():
+    engine = make_engine(A=0)
+    engine.order_stock("A", 5)
+    with pytest.raises(ReservationError):
+        engine.reserve("A", 1)
+    engine.receive_stock("A", 5)
+    level = engine.get_level("A")
+    assert (level.on_hand, level.incoming, level.available) == (5, 0, 5)
+
+
+def test_sqlite_engine_shared_across_processes(tmp_path):
+    import multiprocessing
+
+    from Modules.inventory import SqliteInventoryEngine
+
+    db_path = str(tmp_path / "inventory.sqlite3")
+    SqliteInventoryEngine(db_path).set_stock("A", 150)
+
+    def worker(results):
+        engine = SqliteInventoryEngine(db_path)
+        ok = 0
+        for _ in range(100):
+            try:
+                engine.reserve("A", 1)
+                ok += 1
+            except ReservationError:
+                pass
+        results.put(ok)
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(results,)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert sum(results.get() for _ in processes) == 150
+    level = SqliteInventoryEngine(db_path).get_level("A")
+    assert (level.reserved, level.available) == (150, 0)
+
+
+def test_sqlite_engine_accounting(tmp_path):
+    from Modules.inventory import SqliteInventoryEngine
+
+    engine = SqliteInventoryEngine(str(tmp_path / "inventory.sqlite3"))
+    engine.seed_stock({"A": 10, "B": 1})
+    engine.seed_stock({"A": 99})
+    with pytest.raises(ReservationError):
+        engine.reserve_batch({"A": 5, "B": 2})
+
+    committed = engine.reserve("A", 3)
+    expiring = engine.reserve("A", 4, ttl_seconds=-1)
+    engine.commit(committed.reservation_id)
+    with pytest.raises(ReservationError):
+        engine.commit(expiring.reservation_id)
+
+    level = engine.get_level("A")
+    assert (level.on_hand, level.reserved, level.available) == (7, 0, 7)
+
+
+def test_expiry_sweeper_survives_engine_errors():
+    calls = []
+
+    class FlakyEngine:
+        def expire(self):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            return []
+
+    thread, stop = start_expiry_sweeper(FlakyEngine(), interval_seconds=0.01)
+    deadline = time.monotonic() + 2
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join(timeout=1)
+    assert len(calls) >= 3
@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from Modules import jobs
+from Modules.jobs import (
+    INTERRUPTED_ERROR,
+    InvalidJobError,
+    JobQueue,
+    QueueFullError,
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_RUNNING,
+)
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(db_path=str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_jobs_run_by_priority(tmp_path):
+    queue = make_queue(tmp_path, workers=1)
+    order = []
+    queue.register("t", order.append)
+    for payload, priority in (("low", 9), ("normal", 5), ("high", 0), ("normal-2", 5)):
+        queue.submit("t", payload, priority=priority)
+    queue.start()
+    try:
+        wait_for(lambda: len(order) == 4)
+    finally:
+        queue.stop()
+    assert order == ["high", "normal", "normal-2", "low"]
+
+
+def test_job_result_and_failure_are_persisted(tmp_path):
+    queue = make_queue(tmp_path, workers=2)
+    queue.register("ok", lambda payload: {"echo": payload})
+    queue.register("boom", lambda payload: 1 / 0)
+    ok = queue.submit("ok", "hello")
+    boom = queue.submit("boom", "x")
+    queue.start()
+    try:
+        wait_for(lambda: queue.get(ok["job_id"])["status"] == STATUS_DONE
+                 and queue.get(boom["job_id"])["status"] == STATUS_FAILED)
+    finally:
+        queue.stop()
+    assert queue.get(ok["job_id"])["result"] == {"echo": "hello"}
+    assert "division" in queue.get(boom["job_id"])["error"]
+
+
+def test_worker_survives_store_errors(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path, workers=1)
+    done = []
+    queue.register("t", done.append)
+    real_claim = queue._store.claim
+    calls = []
+
+    def flaky_claim(job_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise jobs.sqlite3.OperationalError("database is locked")
+        return real_claim(job_id)
+
+    monkeypatch.setattr(queue._store, "claim", flaky_claim)
+    queue.start()
+    queue.submit("t", "first")
+    try:
+        wait_for(lambda: len(calls) == 1)
+        queue.submit("t", "second")
+        wait_for(lambda: done == ["second"])
+    finally:
+        queue.stop()
+
+
+def _claim_all(db_path, job_ids, results):
+    store = jobs._JobStore(db_path)
+    results.put(sum(store.claim(job_id) for job_id in job_ids))
+
+
+def test_claim_is_exclusive_across_processes(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register("t", lambda payload: payload)
+    job_ids = [queue.submit("t", i)["job_id"] for i in range(50)]
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_claim_all, args=(str(tmp_path / "jobs.sqlite3"), job_ids, results))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert sum(results.get() for _ in processes) == 50
+
+
+def test_recover_fails_running_jobs_of_one_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register("t", lambda payload: payload)
+    mine = queue.submit("t", "mine")["job_id"]
+    other = queue.submit("t", "other")["job_id"]
+    queued = queue.submit("t", "queued")["job_id"]
+    queue._store.claim(mine)
+    queue._store.claim(other)
+    queue._store.update(other, worker_pid=os.getpid() + 100000)
+
+    assert queue.recover(worker_pid=os.getpid()) == 1
+    assert queue.get(mine)["status"] == STATUS_FAILED
+    assert queue.get(mine)["error"] == INTERRUPTED_ERROR
+    assert queue.get(other)["status"] == STATUS_RUNNING
+
+    assert queue.recover() == 1
+    assert queue.get(other)["status"] == STATUS_FAILED
+    assert queue.get(queued)["status"] == "QUEUED"
+
+
+def test_queue_full_and_priority_bounds(tmp_path):
+    queue = make_queue(tmp_path, max_pending=2)
+    queue.register("t", lambda payload: payload)
+    queue.submit("t", 1)
+    queue.submit("t", 2)
+    with pytest.raises(QueueFullError):
+        queue.submit("t", 3)
+    with pytest.raises(InvalidJobError):
+        queue.submit("t", 1, priority=10)
+
+
+def test_callback_url_allowlist(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "CALLBACK_ALLOWED_HOSTS", {"hooks.djust.io"})
+    queue = make_queue(tmp_path)
+    queue.register("t", lambda payload: payload)
+    queue.submit("t", 1, callback_url="https://hooks.djust.io/jobs")
+    for url in ("http://169.254.169.254/latest", "file:///etc/passwd", "https://evil.example/hook"):
+        with pytest.raises(InvalidJobError):
+            queue.submit("t", 1, callback_url=url)
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from Modules.retrieval import DOCUMENTS_DIR, BM25Index, HybridRetriever, normalize_text
+
+
+class FakeKnowledge:
+    max_results = 5
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def search(self, query, max_results=None, filters=None, **kwargs):
+        self.calls.append(query)
+        return self.docs
+
+
+def vector_doc(filename, content):
+    return SimpleNamespace(name=filename.rsplit(".", 1)[0], content=content,
+                           meta_data={"source": filename})
+
+
+def read_section(filename, heading):
+    text = (DOCUMENTS_DIR / filename).read_text(encoding="utf-8")
+    return "## " + next(part for part in text.split("## ") if part.startswith(heading))
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    # Les chunks BM25 sont rendus tels quels (Document agno hors du périmètre du test)
+    monkeypatch.setattr(HybridRetriever, "_to_document", staticmethod(lambda chunk: chunk))
+
+    def build(vector_docs=()):
+        knowledge = FakeKnowledge(list(vector_docs))
+        return HybridRetriever(knowledge, BM25Index.from_directory()), knowledge
+
+    return build
+
+
+def test_confident_only_when_one_document_dominates():
+    index = BM25Index.from_directory()
+    # Plusieurs sections du même document ne comptent pas comme concurrentes
+    assert HybridRetriever._is_confident(index.search("payment failure"))
+    assert HybridRetriever._is_confident(index.search("carte bancaire expirée"))
+    # Même section présente dans les trois documents : pas de réponse sûre
+    assert not HybridRetriever._is_confident(index.search("actions recommandées"))
+    assert not HybridRetriever._is_confident([])
+
+
+def test_confident_query_skips_vector_search(retriever):
+    hybrid, knowledge = retriever()
+    results = hybrid.search("carte bancaire expirée")
+    assert knowledge.calls == []
+    assert results[0]["id"] == "payment_failure#2"
+    assert hybrid.metrics()["keyword_only"] == 1
+
+
+def test_fuse_ranks_by_source_and_drops_duplicate_passages(retriever):
+    actions = read_section("payment_failure.md", "Actions recommandées")
+    causes = read_section("payment_failure.md", "Causes possibles")
+    # Passage vecteur plus large (découpage MarkdownReader) qui contient le chunk BM25 "Actions"
+    ingested = vector_doc("payment_failure.md", "# Payment Failure\n\n" + causes + "\n" + actions)
+    hybrid, knowledge = retriever([ingested])
+
+    results = hybrid.search("actions recommandées", max_results=10)
+
+    assert knowledge.calls == ["actions recommandées"]
+    # payment_failure est classé par les deux listes : il passe en tête
+    assert results[0] is ingested
+    keys = [normalize_text(item.content if hasattr(item, "content") else item["content"]) for item in results]
+    for i, key in enumerate(keys):
+        assert not any(key in other or other in key for other in keys[:i])
+    ids = [item["id"] for item in results[1:]]
+    # Section "Actions" déjà contenue dans le passage vecteur : écartée ; "Description" gardée
+    assert "payment_failure#3" not in ids
+    assert ids[0] == "payment_failure#1"
+    assert {"order_validation#3", "invoice_generation#3"} <= set(ids)
+
+
+def test_reload_replaces_index(retriever):
+    hybrid, _ = retriever()
+    chunks = [chunk for chunk in hybrid.index.chunks if chunk["name"] == "order_validation"]
+    hybrid.reload(chunks)
+    assert {chunk["name"] for chunk, _ in hybrid.index.search("description")} == {"order_validation"}
@@ -0,0 +1,84 @@
+import uuid
+
+import pytest
+
+from Modules.snapshot import SnapshotPublisher, SnapshotReader, _attach, section_crc
+
+
+def level(on_hand, reserved=0, incoming=0):
+    return {"on_hand": on_hand, "reserved": reserved, "available": on_hand - reserved, "incoming": incoming}
+
+
+@pytest.fixture
+def publisher():
+    publisher = SnapshotPublisher(f"djtest_{uuid.uuid4().hex[:8]}")
+    yield publisher
+    publisher.close()
+
+
+def test_publish_and_read(publisher):
+    inventory = {"SKU-%03d" % i: level(i, i // 2) for i in range(40)}
+    publisher.publish({"inventory": inventory, "rules": [{"id": "a#0", "content": "x"}]})
+    reader = SnapshotReader(publisher.name)
+
+    assert reader.generation() == 1
+    assert reader.section("inventory") == inventory
+    assert reader.section("rules") == [{"id": "a#0", "content": "x"}]
+    assert reader.section("missing") is None
+    for sku in ("SKU-000", "SKU-017", "SKU-039"):
+        assert reader.stock_level(sku) == inventory[sku]
+    assert reader.stock_level("SKU-040") is None
+
+
+def test_stock_keys_of_any_length_round_trip(publisher):
+    inventory = {
+        "A" * 31 + "é": level(1),
+        "A" * 32: level(2),
+        "A" * 32 + "-LONG-SUFFIX-1": level(3),
+        "A" * 32 + "-LONG-SUFFIX-2": level(4),
+        "日本語-SKU": level(5),
+        "": level(6),
+    }
+    publisher.publish({"inventory": inventory})
+    reader = SnapshotReader(publisher.name)
+
+    assert reader.section("inventory") == inventory
+    for sku, expected in inventory.items():
+        assert reader.stock_level(sku) == expected
+    assert reader.stock_level("A" * 33) is None
+
+
+def test_generation_swap(publisher):
+    publisher.publish({"inventory": {"SKU-1": level(10)}})
+    reader = SnapshotReader(publisher.name)
+    assert reader.stock_level("SKU-1")["on_hand"] == 10
+
+    for on_hand in (20, 30, 40):
+        publisher.publish({"inventory": {"SKU-1": level(on_hand)}})
+        assert reader.stock_level("SKU-1")["on_hand"] == on_hand
+    assert reader.generation() == 4
+    # Seules les deux dernières générations restent publiées
+    with pytest.raises(FileNotFoundError):
+        _attach(f"{publisher.name}_1")
+
+
+def test_on_refresh_fires_only_when_section_crc_changes(publisher):
+    rules = [{"id": "a#0", "content": "règle"}]
+    publisher.publish({"rules": rules, "dashboard": {"n": 1}})
+    reader = SnapshotReader(publisher.name)
+    preloaded, fresh = [], []
+    # Données déjà chargées (crc connu) : pas de rechargement à l'attache
+    reader.on_refresh("rules", preloaded.append, crc=section_crc("rules", rules))
+    reader.on_refresh("rules", fresh.append)
+
+    reader.section("dashboard")
+    assert preloaded == [] and fresh == [rules]
+
+    publisher.publish({"rules": rules, "dashboard": {"n": 2}})
+    assert reader.section("dashboard") == {"n": 2}
+    assert preloaded == [] and fresh == [rules]
+
+    changed = rules + [{"id": "b#0", "content": "nouvelle"}]
+    publisher.publish({"rules": changed, "dashboard": {"n": 2}})
+    reader.section("dashboard")
+    assert preloaded == [changed] and fresh == [rules, changed]
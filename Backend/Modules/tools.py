@@ -6,6 +6,11 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime
 import random
 
+try:
+    from .inventory import inventory_engine, reservation_to_dict, ReservationError
+except ImportError:
+    from inventory import inventory_engine, reservation_to_dict, ReservationError
+
 
 # =============================
 # Tool 1: fetch_orders (OrderIntakeAgent)
@@ -64,10 +69,14 @@ def notify(message: str, recipient: Optional[str] = None) -> Dict[str, Any]:
     show_result=True,
 )
 def query_inventory(product_id: str) -> Dict[str, Any]:
-    available = random.choice([True, False])
+    level = inventory_engine.get_level(product_id)
     return {
         "product_id": product_id,
-        "available": available,
+        "available": level.available > 0,
+        "available_qty": level.available,
+        "on_hand": level.on_hand,
+        "reserved": level.reserved,
+        "incoming": level.incoming,
         "checked_at": datetime.now().isoformat(),
     }
 
@@ -81,14 +90,64 @@ def query_inventory(product_id: str) -> Dict[str, Any]:
     show_result=True,
 )
 def create_purchase_order(product_id: str, qty: int) -> Dict[str, Any]:
+    if qty <= 0:
+        return {"po_created": False, "product_id": product_id, "error": "qty must be positive"}
+    # Le stock commandé reste "incoming" jusqu'à la réception marchandise
+    incoming = inventory_engine.order_stock(product_id, qty)
     return {
         "po_created": True,
         "product_id": product_id,
         "qty": qty,
+        "incoming_qty": incoming,
         "created_at": datetime.now().isoformat(),
     }
 
 
+# =============================
+# Tool 5b: reserve_order_stock (InventoryAgent)
+# =============================
+@tool(
+    name="reserve_order_stock",
+    description="Réserve atomiquement le stock de toutes les lignes d'une commande",
+    show_result=True,
+)
+def reserve_order_stock(order_id: int, lines: Dict[str, int]) -> Dict[str, Any]:
+    try:
+        reservation = inventory_engine.reserve_batch(lines, order_id=order_id)
+    except ReservationError as e:
+        return {"reserved": False, "order_id": order_id, "error": str(e)}
+    return {"reserved": True, **reservation_to_dict(reservation)}
+
+
+# =============================
+# Tool 5c: commit_reservation / release_reservation (InventoryAgent)
+# =============================
+@tool(
+    name="commit_reservation",
+    description="Confirme une réservation de stock (décrément définitif)",
+    show_result=True,
+)
+def commit_reservation(reservation_id: str) -> Dict[str, Any]:
+    try:
+        reservation = inventory_engine.commit(reservation_id)
+    except ReservationError as e:
+        return {"committed": False, "reservation_id": reservation_id, "error": str(e)}
+    return {"committed": True, **reservation_to_dict(reservation)}
+
+
+@tool(
+    name="release_reservation",
+    description="Libère une réservation de stock (commande annulée ou en échec)",
+    show_result=True,
+)
+def release_reservation(reservation_id: str) -> Dict[str, Any]:
+    try:
+        reservation = inventory_engine.release(reservation_id)
+    except ReservationError as e:
+        return {"released": False, "reservation_id": reservation_id, "error": str(e)}
+    return {"released": True, **reservation_to_dict(reservation)}
+
+
 # =============================
 # Tool 6: generate_invoice (PaymentAgent)
 # =============================
@@ -3,10 +3,12 @@
 # =============================
 
 import json
-from fastapi import FastAPI, HTTPException
+import os
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from fastapi import APIRouter
 
 
@@ -18,7 +20,21 @@ from Modules.Order_to_Cash_Orchestrator import (
     PaymentAgent,
     ExceptionAgent,
     CoordinatorAgent,
+    hybrid_retriever,
+    cassette,
 )
+from Modules.inventory import inventory_engine, start_expiry_sweeper
+from Modules.jobs import (
+    JobQueue,
+    QueueFullError,
+    InvalidJobError,
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    PRIORITY_LOW,
+)
+from Modules.admission import admission_controller, admission_lane, AdmissionRejected, JOB_MAX_WAIT_SECONDS
+from Modules.snapshot import SnapshotPublisher, SnapshotReader, SNAPSHOT_ENV, section_crc
+from Modules.serving import serve_prefork, is_prefork_worker
 
 
 # =============================
@@ -39,6 +55,91 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Libération périodique des réservations de stock expirées
+@app.on_event("startup")
+def start_inventory_sweeper():
+    start_expiry_sweeper(inventory_engine)
+
+# =============================
+# File de jobs (runs multi-agents longs)
+# =============================
+def lane_runner(lane: str, runnable):
+    """
+    Runner de job : les appels modèle du run débitent le quota fournisseur dans `lane`,
+    avec l'attente longue des jobs (un appel refusé ferait échouer tout le job).
+    """
+    def _run(content: str):
+        with admission_lane(lane, max_wait=JOB_MAX_WAIT_SECONDS):
+            return runnable.run(input={"role": "user", "content": content})
+
+    return _run
+
+
+job_queue = JobQueue()
+job_queue.register("team", lane_runner("summary", OrderToCashTeam))
+job_queue.register("coordinator", lane_runner("summary", CoordinatorAgent))
+
+@app.on_event("startup")
+def start_job_queue():
+    # En mode pré-forké, les jobs RUNNING interrompus sont marqués FAILED une seule fois par le maître
+    if not is_prefork_worker():
+        job_queue.recover()
+    job_queue.start()
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    job_queue.stop()
+
+
+def submit_job(target: str, content: str, priority: int, callback_url: Optional[str]):
+    try:
+        job = job_queue.submit(target, content, priority=priority, callback_url=callback_url)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except InvalidJobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job["job_id"], "status": job["status"], "poll_url": f"/api/jobs/{job['job_id']}"},
+    )
+
+# =============================
+# Contrôle d'admission (quota modèle partagé)
+# =============================
+def too_busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))},
+    )
+
+
+def admission(route: str, lane: str):
+    """
+    Dépendance FastAPI asynchrone (aucun thread du pool n'est bloqué) :
+    débit de la route et requêtes simultanées de la lane, sinon 429.
+    """
+    async def _admit():
+        try:
+            admission_controller.enter_route(route, lane)
+        except AdmissionRejected as e:
+            raise too_busy(e)
+        try:
+            yield
+        finally:
+            admission_controller.leave_route(lane)
+
+    return Depends(_admit)
+
+
+def run_in_lane(lane: str, runnable, content: str):
+    """Exécute l'agent / l'équipe ; ses appels modèle attendent le quota fournisseur dans `lane`."""
+    with admission_lane(lane):
+        try:
+            return runnable.run(input={"role": "user", "content": content})
+        except AdmissionRejected as e:
+            raise too_busy(e)
+
 # =============================
 # Modèles Pydantic pour validation
 # =============================
@@ -55,6 +156,10 @@ class PaymentRequest(BaseModel):
     order_id: int
     invoice_id: str = None
 
+class StockReceipt(BaseModel):
+    product_id: str
+    qty: int
+
 class ExceptionRequest(BaseModel):
     order_id: int
     error: str
@@ -80,57 +185,93 @@ def home():
 
 
 # ---- ORDER INTAKE ----
-@app.post("/api/order/validate")
+@app.post("/api/order/validate", dependencies=[admission("/api/order/validate", "intake")])
 def validate_orders(req: OrderProcessRequest):
     try:
-        response = OrderIntakeAgent.run(
-            input={"role": "user", "content": json.dumps([order.dict() for order in req.orders])}
+        response = run_in_lane(
+            "intake", OrderIntakeAgent, json.dumps([order.dict() for order in req.orders])
         )
         return {"agent": "OrderIntakeAgent", "result": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---- INVENTORY ----
-@app.post("/api/inventory/check")
+@app.post("/api/inventory/check", dependencies=[admission("/api/inventory/check", "intake")])
 def check_inventory(req: OrderProcessRequest):
     try:
         product_ids = [sku for order in req.orders for sku in order.products]
-        response = InventoryAgent.run(
-            input={"role": "user", "content": json.dumps({"product_ids": product_ids})}
-        )
+        response = run_in_lane("intake", InventoryAgent, json.dumps({"product_ids": product_ids}))
         return {"agent": "InventoryAgent", "result": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/inventory/receive")
+def receive_stock(req: StockReceipt):
+    """Réception marchandise d’un réapprovisionnement (seule entrée de stock physique)."""
+    if req.qty <= 0:
+        raise HTTPException(status_code=400, detail="qty must be positive")
+    available = inventory_engine.receive_stock(req.product_id, req.qty)
+    return {"product_id": req.product_id, "received": req.qty, "available_qty": available}
+
+
+@app.get("/api/inventory/levels")
+def get_inventory_levels():
+    return read_model("inventory")
+
+
+@app.get("/api/inventory/levels/{sku}")
+def get_inventory_level(sku: str):
+    # Lecture directe dans le snapshot partagé, sans décoder toute la table
+    level = snapshot_reader.stock_level(sku) if snapshot_reader is not None else None
+    if level is None:
+        level = read_model("inventory").get(sku)
+    if level is None:
+        raise HTTPException(status_code=404, detail=f"Unknown SKU '{sku}'")
+    return {"sku": sku, **level}
+
+
 # ---- PAYMENT ----
-@app.post("/api/payment/process")
+@app.post("/api/payment/process", dependencies=[admission("/api/payment/process", "payment")])
 def process_payment(req: PaymentRequest):
     try:
-        response = PaymentAgent.run(
-            input={"role": "user", "content": json.dumps(req.dict())}
-        )
+        response = run_in_lane("payment", PaymentAgent, json.dumps(req.dict()))
         return {"agent": "PaymentAgent", "result": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---- EXCEPTION ----
-@app.post("/api/exception/handle")
+@app.post("/api/exception/handle", dependencies=[admission("/api/exception/handle", "exception")])
 def handle_exception(req: ExceptionRequest):
     try:
-        response = ExceptionAgent.run(
-            input={"role": "user", "content": json.dumps(req.dict())}
-        )
+        response = run_in_lane("exception", ExceptionAgent, json.dumps(req.dict()))
         return {"agent": "ExceptionAgent", "result": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ---- COORDINATOR ----
-@app.post("/api/coordinator/summary")
-def generate_summary(req: OrderProcessRequest):
+@app.post(
+    "/api/coordinator/summary",
+    dependencies=[admission("/api/coordinator/summary", "summary")],
+)
+def generate_summary(
+    req: OrderProcessRequest,
+    background: bool = False,
+    priority: int = Query(PRIORITY_NORMAL, ge=PRIORITY_HIGH, le=PRIORITY_LOW),
+    callback_url: Optional[str] = None,
+):
+    """Exécution synchrone, ou job en file si background=true (réponse 202 + job_id)."""
     try:
         product_ids = [sku for order in req.orders for sku in order.products]
         input_data = {
@@ -139,8 +280,12 @@ def generate_summary(req: OrderProcessRequest):
             "payments": [{"order_id": o.order_id} for o in req.orders],
             "exceptions": [],
         }
-        response = CoordinatorAgent.run(input={"role": "user", "content": json.dumps(input_data)})
+        if background:
+            return submit_job("coordinator", json.dumps(input_data), priority, callback_url)
+        response = run_in_lane("summary", CoordinatorAgent, json.dumps(input_data))
         return {"agent": "CoordinatorAgent", "result": response}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -156,46 +301,125 @@ def get_team_info():
     }
 
 
-@app.post("/team/query")
-def query_team(message: Dict[str, str]):
-    """Envoie une requête à l’équipe complète (multi-agents)."""
+@app.post("/team/query", dependencies=[admission("/team/query", "summary")])
+def query_team(
+    message: Dict[str, str],
+    background: bool = False,
+    priority: int = Query(PRIORITY_NORMAL, ge=PRIORITY_HIGH, le=PRIORITY_LOW),
+    callback_url: Optional[str] = None,
+):
+    """Envoie une requête à l’équipe complète (multi-agents), en job si background=true."""
     try:
         user_message = message.get("message", "")
-        result = OrderToCashTeam.run(input={"role": "user", "content": user_message})
+        if background:
+            return submit_job("team", user_message, priority, callback_url)
+        result = run_in_lane("summary", OrderToCashTeam, user_message)
         return {"team": OrderToCashTeam.name, "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ---- METRICS ----
+@app.get("/api/metrics/admission")
+def get_admission_metrics():
+    """Attente des appels modèle par lane, requêtes en cours, profondeur et rejets."""
+    return admission_controller.metrics()
+
+
+@app.get("/api/metrics/retrieval")
+def get_retrieval_metrics():
+    """Requêtes KB servies par BM25 seul vs hybride, latence et appels d’embedding."""
+    return hybrid_retriever.metrics()
+
+
+# ---- JOBS ----
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Statut et résultat d’un job soumis en mode background."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 
 router = APIRouter(prefix="/api", tags=["Dashboard"])
 
+DASHBOARD_SUMMARY = {
+    "total_orders": 120,
+    "active_inventory": 8,
+    "payments_total": 35700,
+    "active_exceptions": 3,
+    "exceptions_today": 1,
+}
+
+DASHBOARD_ORDERS = [
+    {"order_id": 101, "customer": "Alice", "total": 1200, "status": "validated"},
+    {"order_id": 102, "customer": "Bob", "total": 800, "status": "pending"},
+    {"order_id": 103, "customer": "Charlie", "total": 950, "status": "failed"},
+    {"order_id": 104, "customer": "David", "total": 1350, "status": "validated"},
+]
+
+DASHBOARD_EXCEPTIONS = [
+    {"order_id": 103, "type": "Payment", "error": "Card declined", "status": "active"},
+    {"order_id": 110, "type": "Inventory", "error": "Out of stock", "status": "active"},
+    {"order_id": 120, "type": "Billing", "error": "Invoice mismatch", "status": "resolved"},
+]
+
 @router.get("/dashboard/summary")
 def get_summary():
-    return {
-        "total_orders": 120,
-        "active_inventory": 8,
-        "payments_total": 35700,
-        "active_exceptions": 3,
-        "exceptions_today": 1,
-    }
+    return read_model("dashboard")["summary"]
 
 @router.get("/order/all")
 def get_orders():
-    return [
-        {"order_id": 101, "customer": "Alice", "total": 1200, "status": "validated"},
-        {"order_id": 102, "customer": "Bob", "total": 800, "status": "pending"},
-        {"order_id": 103, "customer": "Charlie", "total": 950, "status": "failed"},
-        {"order_id": 104, "customer": "David", "total": 1350, "status": "validated"},
-    ]
+    return read_model("dashboard")["orders"]
 
 @router.get("/exceptions/active")
 def get_exceptions():
-    return [
-        {"order_id": 103, "type": "Payment", "error": "Card declined", "status": "active"},
-        {"order_id": 110, "type": "Inventory", "error": "Out of stock", "status": "active"},
-        {"order_id": 120, "type": "Billing", "error": "Invoice mismatch", "status": "resolved"},
-    ]
+    return read_model("dashboard")["exceptions"]
+
+
+# =============================
+# Read-model (snapshot partagé en mode pré-forké)
+# =============================
+READ_MODEL_BUILDERS = {
+    "inventory": inventory_engine.snapshot,
+    "dashboard": lambda: {
+        "summary": DASHBOARD_SUMMARY,
+        "orders": DASHBOARD_ORDERS,
+        "exceptions": DASHBOARD_EXCEPTIONS,
+    },
+    "rules": lambda: hybrid_retriever.index.chunks,
+}
+
+snapshot_reader: Optional[SnapshotReader] = None
+
+
+def build_read_model() -> Dict[str, Any]:
+    return {section: builder() for section, builder in READ_MODEL_BUILDERS.items()}
+
+
+def read_model(section: str):
+    """Section du snapshot partagé si un maître le publie, sinon calcul local."""
+    if snapshot_reader is not None:
+        value = snapshot_reader.section(section)
+        if value is not None:
+            return value
+    return READ_MODEL_BUILDERS[section]()
+
+
+@app.on_event("startup")
+def attach_snapshot():
+    global snapshot_reader
+    snapshot_reader = SnapshotReader.from_env()
+    if snapshot_reader is not None:
+        # L'index BM25 préchargé par le maître (partagé en copy-on-write) n'est
+        # reconstruit que si les règles publiées diffèrent de celles qui l'ont construit
+        snapshot_reader.on_refresh("rules", hybrid_retriever.reload,
+                                   crc=section_crc("rules", hybrid_retriever.index.chunks))
+        snapshot_reader.watch()
 
 
 
@@ -205,6 +429,44 @@ def get_exceptions():
 # Lancement
 # =============================
 if __name__ == "__main__":
-    import uvicorn
-    print("🚀 Starting DJUST Order-to-Cash API...")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    workers = int(os.getenv("DJUST_WORKERS", "1"))
+    if workers > 1 and hasattr(os, "fork"):
+        # Production : modules déjà chargés ici, workers forkés ensuite (copy-on-write)
+        publisher = SnapshotPublisher()
+        os.environ[SNAPSHOT_ENV] = publisher.name
+        publisher.publish(build_read_model())
+        job_queue.recover()
+
+        def worker_start(worker_id: int):
+            # Quota fournisseur / débit de route partagés : chaque worker en reçoit 1/N
+            admission_controller.share_between(workers)
+            if cassette is not None:
+                cassette.for_worker(worker_id)
+
+        def worker_stop(worker_id: int):
+            # os._exit n'exécute pas les handlers atexit : sauvegarde explicite
+            if cassette is not None:
+                cassette.save()
+
+        def worker_exit(pid: int):
+            # Jobs RUNNING du worker mort : FAILED "interrupted", comme après un arrêt
+            job_queue.recover(worker_pid=pid)
+
+        try:
+            serve_prefork(
+                app,
+                host="0.0.0.0",
+                port=int(os.getenv("PORT", "8000")),
+                workers=workers,
+                refresh=lambda: publisher.publish(build_read_model()),
+                refresh_interval=float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "5")),
+                on_worker_start=worker_start,
+                on_worker_stop=worker_stop,
+                on_worker_exit=worker_exit,
+            )
+        finally:
+            publisher.close()
+    else:
+        import uvicorn
+        print("🚀 Starting DJUST Order-to-Cash API...")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)